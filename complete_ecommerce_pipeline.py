@@ -5,31 +5,120 @@ Orchestrates the complete flow:
 1. Runs ecommerce_stealth_crawler_fixed.py to get search results
 2. Runs markdown_product_url_extractor.py to extract product URLs intelligently
 3. Manages API limits and timing effectively
+
+Steps run in-process by default (each script exposes a run() entrypoint);
+pass --subprocess to launch every step in its own interpreter instead, or
+--sites to run one subprocess pipeline per site concurrently. --streaming
+overlaps steps 2-5 so scraping and Gemini processing start on the first URLs.
 """
 
+import argparse
 import asyncio
-import subprocess
+import contextlib
+import csv
+import functools
+import importlib
+import multiprocessing
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
-import json
+import re
 import sys
+from dataclasses import dataclass
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from pipeline_io import atomic_open, drop_page_cache, iter_jsonl, loads, write_jsonl
+from pipeline_urls import canonical_url
+from pipeline_worker import WarmWorkerPool
+
+def _count_newlines(f) -> int:
+    """Count newlines in the rest of a binary file - one streaming pass, no decoded copy or line list."""
+    count = 0
+    while chunk := f.read(1 << 16):
+        count += chunk.count(b'\n')
+    return count
+
+@functools.lru_cache(maxsize=128)
+def _file_stats(filename: str, mtime: float, size: int) -> Dict[str, Any]:
+    """Read and summarize a file; cached on (path, mtime, size) so unchanged files aren't re-parsed."""
+    try:
+        stats = {
+            "exists": True,
+            "size_bytes": size,
+            "modified_time": datetime.fromtimestamp(mtime).isoformat()
+        }
+        
+        # Additional stats for specific file types
+        if filename.endswith('.md'):
+            with open(filename, 'rb') as f:
+                line_count = _count_newlines(f)
+            stats["content_length"] = size
+            stats["line_count"] = line_count + 1
+        
+        elif filename.endswith('.jsonl'):
+            # Header line says what the items are; every further line is one item
+            with open(filename, 'rb') as f:
+                header = loads(f.readline() or b'{}')
+                item_count = _count_newlines(f)
+            stats["url_count" if "extraction_metadata" in header else "product_count"] = item_count
+        
+        elif filename.endswith('.json'):
+            # Bytes straight into orjson (when installed) - no separate UTF-8 decode
+            with open(filename, 'rb') as f:
+                data = loads(f.read())
+                if isinstance(data, dict):
+                    if "product_urls" in data:
+                        stats["url_count"] = len(data["product_urls"])
+                    elif "products" in data:
+                        stats["product_count"] = len(data["products"])
+        
+        return stats
+        
+    except Exception as e:
+        return {"exists": True, "error": str(e)}
+
+@dataclass(frozen=True, slots=True)
+class PipelineStep:
+    """One resolved pipeline step (see EcommercePipeline.plan)."""
+    num: int
+    name: str
+    script: str
+    script_abs: str
+    description: str
+    output_file: str
+    required_input: Optional[str]
 
 class EcommercePipeline:
-    def __init__(self):
+    def __init__(self, in_process: bool = True, persist: bool = False, workdir: str = None,
+                 env: Dict[str, str] = None, semaphore: asyncio.BoundedSemaphore = None,
+                 streaming: bool = False, workers: WarmWorkerPool = None):
         """Initialize the complete e-commerce pipeline."""
         self.pipeline_start_time = time.time()
         
+        # Execution mode: import step modules and hand results over in memory,
+        # or fall back to one interpreter per step for isolation
+        self.in_process = in_process
+        self.persist = persist
+        self.stage_results = {}  # step number -> in-memory output of that step
+        
+        # Overlap steps 2-5 through queues instead of running them back to back
+        self.streaming = streaming and in_process
+        self.scrape_workers = 3  # Concurrent product page scrapes in streaming mode
+        
+        # Subprocess steps run inside workdir (None = current directory) with env;
+        # the semaphore bounds how many steps run at once across pipelines
+        self.workdir = workdir
+        self.env = env
+        self.semaphore = semaphore or asyncio.BoundedSemaphore(1)
+        # Subprocess steps go to these already-imported interpreters when given
+        self.workers = workers
+        
+        # Subprocess step output is tee'd here so runs can be reviewed offline
+        self.log_file = "pipeline_run.log"
+        
         # File tracking
         self.files_created = []
         
-        # API management for markdown extractor
-        self.chunk_size = 3000  # Smaller chunks to avoid API limits
-        self.delay_between_chunks = 5  # 5 seconds between chunks
-        self.max_chunks_per_batch = 10  # Process max 10 chunks, then longer break
-        self.batch_break_time = 30  # 30 seconds break between batches
-        
         # Pipeline steps configuration
         self.pipeline_steps = {
             1: {
@@ -43,36 +132,78 @@ class EcommercePipeline:
                 "name": "AI Product URL Extraction",
                 "script": "markdown_product_url_extractor.py", 
                 "description": "Extract product URLs from markdown using AI",
-                "output_file": "rakuten_product_urls_from_markdown.json",
+                "output_file": "rakuten_product_urls_from_markdown.jsonl",
                 "required_input": "rakuten.md"
             },
             3: {
                 "name": "Bulk Product Scraping",
                 "script": "rakuten_bulk_product_scraper.py",
                 "description": "Scrape product details from URLs",
-                "output_file": "rakuten.json",
-                "required_input": "rakuten_product_urls_from_markdown.json"
+                "output_file": "rakuten.jsonl",
+                "required_input": "rakuten_product_urls_from_markdown.jsonl"
             },
             4: {
                 "name": "Gemini Product Processing",
                 "script": "rakuten_gemini_processor.py",
                 "description": "Extract structured product data using Gemini AI",
-                "output_file": "rakuten_final.json",
-                "required_input": "rakuten.json"
+                "output_file": "rakuten_final.jsonl",
+                "required_input": "rakuten.jsonl"
             },
             5: {
                 "name": "CSV Conversion",
                 "script": "rakuten_csv_converter.py",
                 "description": "Convert structured data to CSV format",
                 "output_file": "rakuten.csv",
-                "required_input": "rakuten_final.json"
+                "required_input": "rakuten_final.jsonl"
             }
         }
         
+        # Resolve the interpreter and script paths once. An absolute executable
+        # is also what lets subprocess take its posix_spawn fast path.
+        self.python = os.path.abspath(sys.executable)
+        for step_info in self.pipeline_steps.values():
+            step_info['script_abs'] = os.path.abspath(step_info['script'])
+        
+        # The same steps as an ordered tuple, so a run is just a slice of it
+        self.plan = tuple(
+            PipelineStep(num, info['name'], info['script'], info['script_abs'],
+                         info['description'], info['output_file'], info['required_input'])
+            for num, info in sorted(self.pipeline_steps.items())
+        )
+        
+        # Snapshot of every step input/output file (name -> stat result or None),
+        # refreshed per run and per finished step instead of re-stat'ing on every check
+        self._all_paths = {s['output_file'] for s in self.pipeline_steps.values()} | \
+                          {s['required_input'] for s in self.pipeline_steps.values() if s['required_input']}
+        self._fs = {}
+        
         print("🚀 Complete E-commerce Pipeline Initialized")
         print("=" * 60)
 
-    def run_script(self, script_name: str, description: str) -> bool:
+    @staticmethod
+    def _stat(path: str) -> Optional[os.stat_result]:
+        """Stat a file, returning None if it doesn't exist (one syscall for exists + size)."""
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    def refresh_fs(self, filenames=None):
+        """Re-stat the given pipeline files (default: all of them) into the snapshot."""
+        for filename in (filenames or self._all_paths):
+            self._fs[filename] = self._stat(self._path(filename))
+
+    def stat_file(self, filename: str) -> Optional[os.stat_result]:
+        """Stat result for a pipeline file from the snapshot (None if it doesn't exist)."""
+        if filename not in self._fs:
+            self.refresh_fs([filename])
+        return self._fs[filename]
+
+    def _path(self, filename: str) -> str:
+        """Resolve a pipeline file name inside this pipeline's work directory."""
+        return os.path.join(self.workdir, filename) if self.workdir else filename
+
+    async def run_script(self, script_name: str, description: str) -> bool:
         """Run a Python script and return success status."""
         try:
             print(f"\n🔄 Step: {description}")
@@ -82,19 +213,79 @@ class EcommercePipeline:
             # Start timing
             step_start = time.time()
             
-            # Run the script with current Python environment
-            result = subprocess.run([
-                sys.executable, script_name
-            ], capture_output=False, text=True, cwd=os.getcwd())
+            if self.workers:
+                # A warm worker already has the step's heavy imports loaded
+                sys.stdout.flush()
+                with open(self._path(self.log_file), 'ab') as log_fh:
+                    ok = await self.workers.submit(os.path.splitext(script_name)[0], self.workdir, self.env,
+                                                   functools.partial(self._echo, log_fh))
+                returncode = 0 if ok else 1
+            else:
+                # Run the script with current Python environment. An absolute
+                # interpreter path, inherited cwd (no workdir) and close_fds=False (our
+                # own fds are non-inheritable anyway, PEP 446) let subprocess use
+                # posix_spawn instead of fork+exec of this (large) orchestrator process.
+                proc = await asyncio.create_subprocess_exec(
+                    self.python, script_name,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                    cwd=self.workdir, env=self.env, close_fds=False, limit=1 << 20
+                )
+                await self._forward_output(proc.stdout)
+                returncode = await proc.wait()
             
             step_time = time.time() - step_start
             
-            if result.returncode == 0:
+            if returncode == 0:
                 print(f"✅ {description} completed successfully")
                 print(f"⏱️ Time taken: {step_time:.1f} seconds")
                 return True
             else:
-                print(f"❌ {description} failed with return code: {result.returncode}")
+                print(f"❌ {description} failed with return code: {returncode}")
+                return False
+                
+        except Exception as e:
+            print(f"❌ Error running {script_name}: {str(e)}")
+            return False
+
+    async def _forward_output(self, stream: asyncio.StreamReader):
+        """Copy a step's combined output to the terminal and the run log in 64 KiB chunks."""
+        sys.stdout.flush()  # keep our own buffered prints ahead of the child's output
+        with open(self._path(self.log_file), 'ab') as log_fh:
+            while chunk := await stream.read(1 << 16):
+                self._echo(log_fh, chunk)
+
+    @staticmethod
+    def _echo(log_fh, chunk: bytes):
+        """Write a piece of step output to the terminal and the run log."""
+        sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        log_fh.write(chunk)
+
+    async def run_module(self, step_num: int, input_obj: Any = None, persist: bool = True) -> bool:
+        """Import a step's script as a module and call its run() entrypoint in-process."""
+        step_info = self.pipeline_steps[step_num]
+        script_name = step_info['script']
+        description = step_info['description']
+        try:
+            print(f"\n🔄 Step: {description}")
+            print(f"📄 Running in-process: {script_name}")
+            print("-" * 40)
+            
+            step_start = time.time()
+            
+            # Scripts drive their own event loops, so run them off this one
+            module = importlib.import_module(os.path.splitext(script_name)[0])
+            result = await asyncio.to_thread(module.run, input_obj, persist=persist)
+            
+            step_time = time.time() - step_start
+            
+            if result:
+                self.stage_results[step_num] = result
+                print(f"✅ {description} completed successfully")
+                print(f"⏱️ Time taken: {step_time:.1f} seconds")
+                return True
+            else:
+                print(f"❌ {description} produced no output")
                 return False
                 
         except Exception as e:
@@ -103,8 +294,9 @@ class EcommercePipeline:
 
     def check_file_exists(self, filename: str, description: str) -> bool:
         """Check if a required file exists."""
-        if os.path.exists(filename):
-            file_size = os.path.getsize(filename)
+        st = self.stat_file(filename)
+        if st:
+            file_size = st.st_size
             print(f"✅ {description} exists: {filename} ({file_size:,} bytes)")
             return True
         else:
@@ -112,37 +304,15 @@ class EcommercePipeline:
             return False
 
     def get_file_stats(self, filename: str) -> Dict[str, Any]:
-        """Get statistics about a file."""
+        """Get statistics about a file (parsed once per file version)."""
         try:
-            if not os.path.exists(filename):
-                return {"exists": False}
-            
-            stats = {
-                "exists": True,
-                "size_bytes": os.path.getsize(filename),
-                "modified_time": datetime.fromtimestamp(os.path.getmtime(filename)).isoformat()
-            }
-            
-            # Additional stats for specific file types
-            if filename.endswith('.md'):
-                with open(filename, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    stats["content_length"] = len(content)
-                    stats["line_count"] = len(content.split('\n'))
-            
-            elif filename.endswith('.json'):
-                with open(filename, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if isinstance(data, dict):
-                        if "product_urls" in data:
-                            stats["url_count"] = len(data["product_urls"])
-                        elif "products" in data:
-                            stats["product_count"] = len(data["products"])
-            
-            return stats
-            
+            st = os.stat(filename)
+        except FileNotFoundError:
+            return {"exists": False}
         except Exception as e:
             return {"exists": True, "error": str(e)}
+        
+        return dict(_file_stats(filename, st.st_mtime, st.st_size))
 
     def check_input_requirements(self, step_num: int) -> bool:
         """Check if required input files exist for a given step."""
@@ -154,8 +324,9 @@ class EcommercePipeline:
         if not required_input:
             return True  # No input required
             
-        if os.path.exists(required_input):
-            file_size = os.path.getsize(required_input)
+        st = self.stat_file(required_input)
+        if st:
+            file_size = st.st_size
             print(f"✅ Required input exists: {required_input} ({file_size:,} bytes)")
             return True
         else:
@@ -164,126 +335,506 @@ class EcommercePipeline:
 
     def display_pipeline_options(self):
         """Display available pipeline steps and options."""
-        print(f"\n📋 AVAILABLE PIPELINE STEPS:")
-        print("-" * 60)
+        self.refresh_fs()
+        lines = [f"\n📋 AVAILABLE PIPELINE STEPS:", "-" * 60]
         for step_num, step_info in self.pipeline_steps.items():
-            status = "✅" if not step_info["required_input"] or os.path.exists(step_info["required_input"]) else "❌"
-            print(f"  {step_num}. {status} {step_info['name']}")
-            print(f"     → {step_info['description']}")
+            status = "✅" if not step_info["required_input"] or self.stat_file(step_info["required_input"]) else "❌"
+            lines.append(f"  {step_num}. {status} {step_info['name']}")
+            lines.append(f"     → {step_info['description']}")
             if step_info["required_input"]:
-                print(f"     📄 Requires: {step_info['required_input']}")
-            print(f"     💾 Outputs: {step_info['output_file']}")
-            print()
+                lines.append(f"     📄 Requires: {step_info['required_input']}")
+            lines.append(f"     💾 Outputs: {step_info['output_file']}")
+            lines.append("")
+        print_lines(lines)
 
-    def run_pipeline_from_step(self, start_step: int = 1, end_step: int = None):
+    async def run_pipeline_from_step(self, start_step: int = 1, end_step: int = None):
         """Run pipeline starting from a specific step."""
+        step_count = len(self.plan)
         if end_step is None:
-            end_step = len(self.pipeline_steps)
+            end_step = step_count
             
         print(f"🎯 Running pipeline from step {start_step} to {end_step}")
         
         # Validate step range
-        if start_step < 1 or start_step > len(self.pipeline_steps):
+        if start_step < 1 or start_step > step_count:
             print(f"❌ Invalid start step: {start_step}")
             return False
             
-        if end_step < start_step or end_step > len(self.pipeline_steps):
+        if end_step < start_step or end_step > step_count:
             print(f"❌ Invalid end step: {end_step}")
             return False
 
         success_steps = 0
+        self.refresh_fs()
         
-        for step_num in range(start_step, end_step + 1):
-            step_info = self.pipeline_steps[step_num]
+        # Steps 2-5 can only be overlapped when the run goes all the way to the CSV
+        streaming = self.streaming and start_step <= 2 and end_step == step_count
+        last_sequential_step = 1 if streaming else end_step
+        
+        for step in self.plan[start_step - 1:last_sequential_step]:
+            step_num = step.num
+            
+            print_lines([f"\n{'='*60}",
+                         f"STEP {step_num}/{step_count}: {step.name.upper()}",
+                         f"{'='*60}"])
             
-            print(f"\n{'='*60}")
-            print(f"STEP {step_num}/{len(self.pipeline_steps)}: {step_info['name'].upper()}")
-            print(f"{'='*60}")
+            # Output of the previous step may already be in memory
+            input_obj = self.stage_results.get(step_num - 1) if self.in_process else None
             
             # Check input requirements
-            if not self.check_input_requirements(step_num):
+            if input_obj is None and not self.check_input_requirements(step_num):
                 print(f"❌ Step {step_num} cannot proceed - missing required input")
                 return False
             
+            # Only hit the disk for intermediate outputs when asked to
+            persist = not self.in_process or self.persist or step_num == end_step
+            
             # Run the step
-            if self.run_script(step_info['script'], step_info['description']):
+            async with self.semaphore:
+                if self.in_process:
+                    step_ok = await self.run_module(step_num, input_obj, persist=persist)
+                else:
+                    step_ok = await self.run_script(step.script_abs, step.description)
+            
+            if step_ok:
                 success_steps += 1
+                self.refresh_fs([step.output_file])
+                
+                # The input has been consumed; don't let it crowd the page cache
+                if step.required_input and input_obj is None:
+                    drop_page_cache(self._path(step.required_input))
                 
                 # Check if output was created
-                if self.check_file_exists(step_info['output_file'], f"Step {step_num} output"):
-                    self.files_created.append(step_info['output_file'])
+                if not persist:
+                    print(f"📦 Step {step_num} output handed to next step in memory")
+                elif self.check_file_exists(step.output_file, f"Step {step_num} output"):
+                    self.files_created.append(step.output_file)
                 else:
                     print(f"❌ Step {step_num} output not found - pipeline stopped")
                     return False
-                    
-                # Add delay between steps (except for the last step)
-                if step_num < end_step:
-                    print(f"\n⏳ Waiting 10 seconds before next step...")
-                    time.sleep(10)
             else:
                 print(f"❌ Step {step_num} failed - pipeline stopped")
                 return False
         
+        if streaming:
+            if start_step == 2 and not self.check_input_requirements(2):
+                print(f"❌ Step 2 cannot proceed - missing required input")
+                return False
+            
+            if not await self.run_streaming_steps(self.stage_results.get(1)):
+                print(f"❌ Streaming steps failed - pipeline stopped")
+                return False
+            
+            success_steps += end_step - max(start_step, 2) + 1
+            self.refresh_fs()
+            self.files_created.append(self.plan[end_step - 1].output_file)
+        
         # Pipeline completion summary
         total_time = time.time() - self.pipeline_start_time
         
-        print(f"\n{'='*60}")
-        print(f"🎉 PIPELINE COMPLETED SUCCESSFULLY!")
-        print(f"{'='*60}")
-        print(f"✅ Steps completed: {success_steps}/{end_step - start_step + 1}")
-        print(f"⏱️ Total time: {total_time:.1f} seconds ({total_time/60:.1f} minutes)")
-        print(f"📁 Files created: {len(self.files_created)}")
-        
+        lines = [
+            f"\n{'='*60}",
+            f"🎉 PIPELINE COMPLETED SUCCESSFULLY!",
+            f"{'='*60}",
+            f"✅ Steps completed: {success_steps}/{end_step - start_step + 1}",
+            f"⏱️ Total time: {total_time:.1f} seconds ({total_time/60:.1f} minutes)",
+            f"📁 Files created: {len(self.files_created)}",
+        ]
         for file in self.files_created:
-            stats = self.get_file_stats(file)
+            stats = self.get_file_stats(self._path(file))
             size_info = f" ({stats.get('size_bytes', 0):,} bytes)" if stats.get('exists') else " (missing)"
-            print(f"   • {file}{size_info}")
+            lines.append(f"   • {file}{size_info}")
+        print_lines(lines)
         
         return True
 
-    def update_markdown_extractor_settings(self):
-        """Update markdown extractor with optimized API settings."""
+    async def run_streaming_steps(self, markdown: str = None) -> bool:
+        """Run steps 2-5 concurrently, connected by asyncio queues.
+        
+        Product URLs are scraped as soon as their extractor chunk is classified,
+        scraped pages go to Gemini in small batches while scraping continues, and
+        structured products are written to the CSV as they arrive - so wall time
+        approaches the slowest step instead of the sum of all steps.
+        """
+        print_lines([f"\n{'='*60}",
+                     f"STEPS 2-{len(self.pipeline_steps)}: STREAMING (URL extraction → scraping → Gemini → CSV)",
+                     f"{'='*60}"])
+        
+        step_start = time.time()
         try:
-            # Read the current file
-            with open('markdown_product_url_extractor.py', 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Update settings for better API management
-            updated_content = content.replace(
-                'self.chunk_size = 4000  # Characters per chunk to process',
-                f'self.chunk_size = {self.chunk_size}  # Optimized for API limits'
-            ).replace(
-                'self.delay_between_requests = 2  # Seconds between API calls',
-                f'self.delay_between_requests = {self.delay_between_chunks}  # Optimized delay'
-            )
-            
-            # Add batch processing logic
-            if 'batch_break_time' not in updated_content:
-                updated_content = updated_content.replace(
-                    'self.delay_between_requests = 5  # Optimized delay',
-                    f'self.delay_between_requests = {self.delay_between_chunks}  # Optimized delay\n        self.max_chunks_per_batch = {self.max_chunks_per_batch}  # Chunks per batch\n        self.batch_break_time = {self.batch_break_time}  # Break between batches'
-                )
+            extractor_module = importlib.import_module('markdown_product_url_extractor')
+            scraper_module = importlib.import_module('rakuten_bulk_product_scraper')
+            processor_module = importlib.import_module('rakuten_gemini_processor')
+            converter_module = importlib.import_module('rakuten_csv_converter')
             
-            # Write back the updated file
-            with open('markdown_product_url_extractor.py', 'w', encoding='utf-8') as f:
-                f.write(updated_content)
+            loop = asyncio.get_running_loop()
+            url_queue = asyncio.Queue()
+            product_queue = asyncio.Queue()
+            final_queue = asyncio.Queue()
+            counts = {"urls": 0, "scraped": 0, "structured": 0, "rows": 0}
+            # Every scraped page and structured product, kept only for --persist
+            # (rakuten.jsonl / rakuten_final.jsonl, like the batch steps write)
+            scraped_products = []
+            structured_products = []
+            chunk_stats = {"chunks": 0, "successful_chunks": 0, "cached": 0}
+            # Set when a step fails, so the extractor thread stops feeding URLs
+            state = {"stopped": False}
             
-            print(f"⚙️ Updated markdown extractor settings:")
-            print(f"   - Chunk size: {self.chunk_size} characters")
-            print(f"   - Delay between chunks: {self.delay_between_chunks} seconds")
-            print(f"   - Max chunks per batch: {self.max_chunks_per_batch}")
-            print(f"   - Batch break time: {self.batch_break_time} seconds")
+            async def extract_urls():
+                """Step 2: classify URLs with Gemini and enqueue each chunk's product URLs."""
+                extractor = extractor_module.MarkdownProductURLExtractor()
+                seen = set()
+                
+                def enqueue(urls: List[str]):
+                    # Runs on the extractor's worker thread
+                    if state["stopped"]:
+                        return  # another step failed; nobody scrapes these any more
+                    for url in urls:
+                        url = canonical_url(url)
+                        if url not in seen and scraper_module.is_scrapable_url(url):
+                            seen.add(url)
+                            loop.call_soon_threadsafe(url_queue.put_nowait, url)
+                
+                try:
+                    await asyncio.to_thread(
+                        extractor.extract_product_urls_from_markdown,
+                        self._path(self.pipeline_steps[1]['output_file']),
+                        self._path(self.pipeline_steps[2]['output_file']),
+                        content=markdown, persist=self.persist, on_product_urls=enqueue
+                    )
+                finally:
+                    for _ in range(self.scrape_workers):
+                        url_queue.put_nowait(None)
+            
+            async def scrape_worker(crawler):
+                """Step 3: scrape product pages until the URL stream ends."""
+                while (url := await url_queue.get()) is not None:
+                    index = counts["urls"]
+                    counts["urls"] += 1
+                    product = await scraper_module.scrape_product_url(crawler, url, index, None)
+                    if self.persist:
+                        scraped_products.append(product)
+                    if product.get('scrape_success'):
+                        counts["scraped"] += 1
+                        await product_queue.put(product)
+            
+            async def scrape_products():
+                """Step 3: run scrape workers on one shared browser; always ends the product stream."""
+                try:
+                    async with scraper_module.AsyncWebCrawler(
+                        config=scraper_module.create_browser_config(), verbose=False
+                    ) as crawler:
+                        await asyncio.gather(*(scrape_worker(crawler) for _ in range(self.scrape_workers)))
+                finally:
+                    await product_queue.put(None)
+                if self.persist:
+                    await asyncio.to_thread(scraper_module.save_results_to_jsonl, scraped_products,
+                                            self._path(self.pipeline_steps[3]['output_file']))
+                    self.files_created.append(self.pipeline_steps[3]['output_file'])
+            
+            async def structure_products():
+                """Step 4: send scraped pages to Gemini in batches of up to chunk_size."""
+                chunk_num = 0
+                done = False
+                try:
+                    processor = processor_module.RakutenGeminiProcessor()
+                    while not done:
+                        batch, done = await _next_batch(product_queue, processor.chunk_size, max_wait=0.2)
+                        if not batch:
+                            continue
+                        
+                        # Pages processed by an earlier run come straight from the cache
+                        cached, batch = await asyncio.to_thread(processor.split_cached, batch)
+                        extracted = [result for result in cached if result is not None]
+                        chunk_stats["cached"] += len(extracted)
+                        if batch:
+                            chunk_num += 1
+                            chunk_results = await asyncio.to_thread(processor.process_chunk_with_gemini, batch, chunk_num)
+                            processor.cache_results(batch, chunk_results)
+                            extracted.extend(chunk_results)
+                            if chunk_results:
+                                chunk_stats["successful_chunks"] += 1
+                        
+                        for product in extracted:
+                            counts["structured"] += 1
+                            if self.persist:
+                                structured_products.append(product)
+                            await final_queue.put(product)
+                finally:
+                    chunk_stats["chunks"] = chunk_num
+                    await final_queue.put(None)
+                if self.persist and structured_products:
+                    header = {"metadata": {
+                        "total_products_processed": counts["scraped"],
+                        "total_chunks": chunk_stats["chunks"],
+                        "successful_chunks": chunk_stats["successful_chunks"],
+                        "extracted_products": len(structured_products),
+                        "processing_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "chunk_size": processor.chunk_size,
+                        "cached_products": chunk_stats["cached"]
+                    }}
+                    await asyncio.to_thread(write_jsonl, self._path(self.pipeline_steps[4]['output_file']),
+                                            header, structured_products)
+                    self.files_created.append(self.pipeline_steps[4]['output_file'])
+            
+            async def write_csv():
+                """Step 5: append each structured product to the CSV as it arrives."""
+                converter = converter_module.RakutenCSVConverter()
+                with contextlib.ExitStack() as stack:
+                    writer = None
+                    while (product := await final_queue.get()) is not None:
+                        # The CSV is only replaced once there are products, so a
+                        # run that structured nothing keeps the previous one
+                        if writer is None:
+                            csvfile = stack.enter_context(atomic_open(self._path(converter.output_file), 'w',
+                                                                      newline='', encoding='utf-8-sig'))
+                            writer = csv.DictWriter(csvfile, fieldnames=converter.csv_columns)
+                            writer.writeheader()
+                        
+                        # Must have Product Name and Web URL at minimum
+                        if not product.get('Product Name') or not product.get('Web URL'):
+                            continue
+                        writer.writerow(converter.prepare_row(product))
+                        counts["rows"] += 1
+            
+            tasks = [asyncio.create_task(step())
+                     for step in (extract_urls, scrape_products, structure_products, write_csv)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # One step failed: stop the others instead of leaving them waiting
+                # on a stream that will never end
+                state["stopped"] = True
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
             
         except Exception as e:
-            print(f"⚠️ Could not update markdown extractor settings: {str(e)}")
+            print(f"❌ Error in streaming steps: {str(e)}")
+            return False
+        
+        step_time = time.time() - step_start
+        print_lines([f"✅ Streaming steps completed",
+                     f"   - Product URLs scraped: {counts['scraped']}/{counts['urls']}",
+                     f"   - Products structured: {counts['structured']}",
+                     f"   - CSV rows written: {counts['rows']}",
+                     f"⏱️ Time taken: {step_time:.1f} seconds"])
+        return counts["rows"] > 0
+
+def print_lines(lines: List[str]):
+    """Print a block of lines with a single write instead of one print() per line."""
+    sys.stdout.write("\n".join(lines) + "\n")
+
+async def _next_batch(queue: asyncio.Queue, max_items: int, max_wait: float):
+    """Collect up to max_items from queue, waiting at most max_wait after the first.
+    
+    A None item marks the end of the stream. Returns (batch, done).
+    """
+    item = await queue.get()
+    if item is None:
+        return [], True
+    
+    batch = [item]
+    deadline = time.monotonic() + max_wait
+    while len(batch) < max_items:
+        remaining = deadline - time.monotonic()
+        try:
+            item = queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(queue.get(), remaining)
+        except (asyncio.QueueEmpty, asyncio.TimeoutError):
+            break
+        if item is None:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+def gemini_quota_share(ways: int) -> Dict[str, str]:
+    """GEMINI_RPM / GEMINI_TPM split evenly between ways concurrent pipeline processes.
+    
+    Each process has its own rate limiter, so without the split every one of
+    them would spend the account's full quota.
+    """
+    share = {'GEMINI_RPM': str(float(os.getenv('GEMINI_RPM', '15')) / ways)}
+    if float(os.getenv('GEMINI_TPM', '0')) > 0:
+        share['GEMINI_TPM'] = str(float(os.getenv('GEMINI_TPM')) / ways)
+    return share
+
+async def run_site_pipelines(sites: List[str], keywords: str, start_step: int = 1,
+                             end_step: int = None, concurrency: int = 3,
+                             warm_workers: int = 0) -> Dict[str, bool]:
+    """Run one subprocess pipeline per site concurrently.
+    
+    Every script reads and writes fixed file names in its working directory, so
+    each site gets its own pipeline_runs/<site> directory. The crawler picks up
+    its keywords and site from ECOMMERCE_KEYWORDS / ECOMMERCE_SITES instead of
+    prompting.
+    """
+    semaphore = asyncio.BoundedSemaphore(concurrency)
+    workers = WarmWorkerPool(warm_workers) if warm_workers else None
+    # Up to concurrency site pipelines call Gemini at once, each from its own process
+    quota = gemini_quota_share(max(1, min(concurrency, len(sites))))
+    pipelines = []
+    for site in sites:
+        workdir = os.path.join("pipeline_runs", site)
+        os.makedirs(workdir, exist_ok=True)
+        env = dict(os.environ, ECOMMERCE_KEYWORDS=keywords, ECOMMERCE_SITES=site, **quota)
+        pipelines.append(EcommercePipeline(in_process=False, workdir=workdir, env=env,
+                                           semaphore=semaphore, workers=workers))
+    
+    try:
+        results = await asyncio.gather(
+            *(pipeline.run_pipeline_from_step(start_step, end_step) for pipeline in pipelines)
+        )
+    finally:
+        if workers:
+            await workers.close()
+    return dict(zip(sites, results))
+
+async def run_pipeline(pipeline: EcommercePipeline, start_step: int, end_step: int = None) -> bool:
+    """Run a pipeline, then shut down its warm workers (if any) on the same event loop."""
+    try:
+        return await pipeline.run_pipeline_from_step(start_step, end_step)
+    finally:
+        if pipeline.workers:
+            await pipeline.workers.close()
+
+def run_keyword_pipeline(site: str, keyword: str, workdir: str, quota: Dict[str, str],
+                         start_step: int = 1, end_step: int = None) -> bool:
+    """Process-pool worker: run the in-process pipeline for one site and keyword inside workdir."""
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    os.environ.update(ECOMMERCE_KEYWORDS=keyword, ECOMMERCE_SITES=site, **quota)
+    pipeline = EcommercePipeline(persist=True)
+    return asyncio.run(pipeline.run_pipeline_from_step(start_step, end_step))
+
+def run_keyword_pipelines(sites: List[str], keywords: List[str], output_file: str = "all_products.jsonl",
+                          max_workers: int = None) -> Dict[str, bool]:
+    """Run one pipeline process per (site, keyword) and merge their products.
+    
+    Workers write to their own pipeline_runs/<site>/<keyword> directories; only
+    this (parent) process appends to output_file, so lines never interleave.
+    The Gemini quota is split evenly between the workers.
+    """
+    jobs = [(site, keyword) for site in sites for keyword in keywords]
+    max_workers = max_workers or min(8, os.cpu_count() or 1, len(jobs))
+    quota = gemini_quota_share(max_workers)
+    
+    # forkserver starts workers from a small clean process instead of copying this one
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    context = multiprocessing.get_context(start_method)
+    
+    results = {}
+    merged = []
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = {}
+        for site, keyword in jobs:
+            workdir = os.path.abspath(os.path.join("pipeline_runs", site, re.sub(r'[\\/:*?"<>|\s]+', '_', keyword)))
+            future = executor.submit(run_keyword_pipeline, site, keyword, workdir, quota)
+            futures[future] = (site, keyword, workdir)
+        
+        for future in as_completed(futures):
+            site, keyword, workdir = futures[future]
+            label = f"{site}/{keyword}"
+            try:
+                results[label] = future.result()
+            except Exception as e:
+                print(f"❌ Pipeline {label} failed: {str(e)}")
+                results[label] = False
+                continue
+            
+            final_file = os.path.join(workdir, "rakuten_final.jsonl")
+            if os.path.exists(final_file):
+                products = iter_jsonl(final_file)
+                next(products, None)  # metadata header
+                merged.extend(dict(product, site=site, keyword=keyword) for product in products)
+            print(f"{'✅' if results[label] else '❌'} Pipeline {label} finished")
+    
+    count = write_jsonl(output_file, {"metadata": {"sites": sites, "keywords": keywords,
+                                                   "generated_at": datetime.now().isoformat()}}, merged)
+    print(f"💾 Merged {count} products into {output_file}")
+    return results
 
 def main():
     """Main function to run the complete pipeline."""
+    parser = argparse.ArgumentParser(description="Complete E-commerce Product URL Pipeline")
+    parser.add_argument("--subprocess", action="store_true",
+                        help="run each step in its own Python interpreter")
+    parser.add_argument("--persist", action="store_true",
+                        help="write every intermediate file, not only the last step's output")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't read or write the Gemini result cache (.cache/)")
+    parser.add_argument("--refresh", action="store_true",
+                        help="ignore cached Gemini results but store the fresh ones")
+    parser.add_argument("--scrape-cache", action="store_true",
+                        help="reuse product pages scraped by earlier runs (.cache/scraped_pages.sqlite)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="overlap steps 2-5 (URL extraction, scraping, Gemini, CSV) via queues")
+    parser.add_argument("--sites",
+                        help="comma-separated sites to run as concurrent pipelines (e.g. rakuten,amazon)")
+    parser.add_argument("--keywords",
+                        help="comma-separated search keywords for --sites runs")
+    parser.add_argument("--concurrency", type=int, default=3,
+                        help="maximum number of steps running at once across --sites pipelines")
+    parser.add_argument("--per-keyword", action="store_true",
+                        help="run one pipeline process per keyword (and site), merged into all_products.jsonl")
+    parser.add_argument("--workers", type=int,
+                        help="process count for --per-keyword (default: min(8, CPUs))")
+    parser.add_argument("--warm-workers", type=int, default=0, metavar="N",
+                        help="run subprocess steps in N pre-imported worker interpreters (implies --subprocess)")
+    args = parser.parse_args()
+    
     print("🔄 Complete E-commerce Pipeline")
     print("=" * 60)
     
+    # Cache mode is read by the Gemini steps (in-process or subprocess)
+    if args.no_cache:
+        os.environ['GEMINI_CACHE'] = 'off'
+    elif args.refresh:
+        os.environ['GEMINI_CACHE'] = 'refresh'
+    if args.scrape_cache:
+        os.environ['SCRAPE_CACHE'] = 'on'
+    
+    # Fan out one pipeline process per keyword
+    if args.per_keyword:
+        sites = [site.strip() for site in (args.sites or 'rakuten').split(',') if site.strip()]
+        keywords = [kw.strip() for kw in (args.keywords or '').split(',') if kw.strip()]
+        if not keywords:
+            print(f"❌ --per-keyword needs --keywords")
+            return
+        
+        print(f"\n🎯 Running {len(sites) * len(keywords)} keyword pipelines in separate processes...")
+        keyword_results = run_keyword_pipelines(sites, keywords, max_workers=args.workers)
+        
+        print_lines([f"\n📊 KEYWORD PIPELINE STATUS:"] +
+                    [f"   {'✅' if keyword_success else '❌'} {label}"
+                     for label, keyword_success in keyword_results.items()])
+        return
+    
+    # Fan out one pipeline per site
+    if args.sites:
+        sites = [site.strip() for site in args.sites.split(',') if site.strip()]
+        try:
+            keywords = args.keywords or input("Keywords (comma-separated): ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print(f"\n❌ Pipeline interrupted by user")
+            return
+        if not keywords:
+            print(f"❌ No keywords provided!")
+            return
+        
+        print(f"\n🎯 Running {len(sites)} site pipelines (concurrency: {args.concurrency})...")
+        site_results = asyncio.run(run_site_pipelines(sites, keywords, concurrency=args.concurrency,
+                                                      warm_workers=args.warm_workers))
+        
+        print_lines([f"\n📊 SITE PIPELINE STATUS:"] +
+                    [f"   {'✅' if site_success else '❌'} {site} → pipeline_runs/{site}"
+                     for site, site_success in site_results.items()])
+        return
+    
     # Initialize pipeline
-    pipeline = EcommercePipeline()
+    workers = WarmWorkerPool(args.warm_workers) if args.warm_workers else None
+    pipeline = EcommercePipeline(in_process=not (args.subprocess or workers), persist=args.persist,
+                                 streaming=args.streaming, workers=workers)
     
     # Check if all scripts exist
     all_scripts = [
@@ -322,7 +873,7 @@ def main():
         if choice == "1":
             # Run complete pipeline
             print(f"\n🎯 Running complete 5-step pipeline...")
-            success = pipeline.run_pipeline_from_step(1, 5)
+            success = asyncio.run(run_pipeline(pipeline, 1, 5))
             
         elif choice == "2":
             # Run from specific step
@@ -332,7 +883,7 @@ def main():
             try:
                 start_step = int(start)
                 end_step = int(end) if end else 5
-                success = pipeline.run_pipeline_from_step(start_step, end_step)
+                success = asyncio.run(run_pipeline(pipeline, start_step, end_step))
             except ValueError:
                 print(f"❌ Invalid step numbers")
                 return
@@ -343,7 +894,7 @@ def main():
             
             try:
                 step_num = int(step)
-                success = pipeline.run_pipeline_from_step(step_num, step_num)
+                success = asyncio.run(run_pipeline(pipeline, step_num, step_num))
             except ValueError:
                 print(f"❌ Invalid step number")
                 return
@@ -361,16 +912,18 @@ def main():
             print(f"\n🎉 Pipeline completed successfully!")
             
             # Show final file statistics
-            final_files = ["rakuten.md", "rakuten_product_urls_from_markdown.json", 
-                          "rakuten.json", "rakuten_final.json", "rakuten.csv"]
+            final_files = ["rakuten.md", "rakuten_product_urls_from_markdown.jsonl", 
+                          "rakuten.jsonl", "rakuten_final.jsonl", "rakuten.csv"]
             
-            print(f"\n📊 FINAL FILE STATUS:")
+            lines = [f"\n📊 FINAL FILE STATUS:"]
             for file in final_files:
-                if os.path.exists(file):
-                    size = os.path.getsize(file)
-                    print(f"   ✅ {file} ({size:,} bytes)")
+                st = pipeline.stat_file(file)
+                if st:
+                    size = st.st_size
+                    lines.append(f"   ✅ {file} ({size:,} bytes)")
                 else:
-                    print(f"   ❌ {file} (not created)")
+                    lines.append(f"   ❌ {file} (not created)")
+            print_lines(lines)
                     
         else:
             print(f"\n❌ Pipeline failed or was interrupted!")
@@ -5,18 +5,24 @@ Searches and scrapes product data from multiple Japanese e-commerce sites
 using keywords and saves markdown results for each website.
 """
 
+import argparse
 import asyncio
+import random
 import time
 import logging
-import json
 import os
 import re
+import sys
 from urllib.parse import quote
-from crawl4ai import AsyncWebCrawler
+from crawl4ai import AsyncWebCrawler, BrowserConfig
 from datetime import datetime
 from typing import Dict, List
 import google.generativeai as genai
 from dotenv import load_dotenv
+from pipeline_cache import ResultCache
+from pipeline_http import (RETRYABLE_STATUS, async_gemini_model, configure_gemini, generate_content_async,
+                           strip_code_fence)
+from pipeline_io import atomic_open, loads, write_json
 
 # Load environment variables
 load_dotenv()
@@ -25,12 +31,139 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Site input (name or URL fragment) -> standard site name, first match wins
+SITE_RULES = [
+    (re.compile(r'rakuten'), 'rakuten'),
+    (re.compile(r'amazon'), 'amazon'),
+    (re.compile(r'yahoo'), 'yahoo'),
+    (re.compile(r'aupay|au pay|wowma|au\.com'), 'aupay'),
+    (re.compile(r'cosme'), 'cosme'),
+]
+
+# Variation indicators stripped by _extract_core_name in a single scan: bracketed
+# notes, colors, and sizes/dimensions/Japanese counts. No branch nests quantifiers,
+# so there is no catastrophic backtracking to guard against.
+VARIATION_PATTERN = re.compile(
+    r'\([^)]*\)|\[[^\]]*\]'
+    r'|\b(?:black|white|red|blue|green|yellow|pink|purple|gray|grey|brown)\b'
+    r'|\b\d+\s*(?:ml|g|kg|oz|lb|l|liter|gram|kilogram)\b|\b\d+\s*[×x]\s*\d+\b|\b\d+\s*[個本]\b'
+)
+
+# Fields where _merge_product_data keeps the longer (more detailed) value
+LONGEST_WINS_FIELDS = frozenset({
+    'Product_Description', 'Brand_Description', 'Full_Ingredient_List',
+    'Marketing_Materials', 'Packaging_Information', 'New_Feature_Promotion',
+})
+
+# Field values the model uses for "not found" (compared after strip + casefold)
+NULL_VALUES = frozenset({'null', 'none', ''})
+
+# Cheap signs that a search-page chunk lists products (a price or a product link);
+# chunks without any are navigation/footer boilerplate and never reach Gemini
+PRODUCT_HINT_PATTERN = re.compile(r'¥|￥|円|price|item\.rakuten\.co\.jp|/dp/[A-Z0-9]{10}|/gp/product/',
+                                  re.IGNORECASE)
+
+def normalize_site_name(site_input: str):
+    """Normalize various site input formats to standard names (None if unknown)"""
+    site_lower = site_input.lower().strip()
+    for pattern, site_name in SITE_RULES:
+        if pattern.search(site_lower):
+            return site_name
+    return None
+
+def field_text(product: Dict, key: str) -> str:
+    """The product field as stripped text ('' when missing)."""
+    value = product.get(key)
+    return '' if value is None else str(value).strip()
+
+def chunked_text(path: str, target_size: int = 12_000):
+    """Yield the file's text in chunks of whole lines, each about target_size characters.
+    
+    Sizing by characters instead of line count keeps the Gemini prompt (and the
+    products it has to return) roughly constant: sparse regions no longer cost a
+    call per 100 blank-ish lines, and dense tables no longer overflow the output.
+    """
+    buf = []
+    buf_len = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            buf.append(line)
+            buf_len += len(line)
+            if buf_len >= target_size:
+                yield ''.join(buf)
+                buf.clear()
+                buf_len = 0
+    if buf:
+        yield ''.join(buf)
+
+def create_search_browser_config() -> BrowserConfig:
+    """Browser for search result pages: JavaScript and fonts as usual, but no image downloads.
+    
+    Image URLs stay in the HTML (and therefore in the markdown); Chromium just
+    doesn't fetch them. Compression (gzip/br) is negotiated by Chromium itself.
+    """
+    return BrowserConfig(
+        headless=True,
+        verbose=False,
+        extra_args=["--blink-settings=imagesEnabled=false"],
+    )
+
+def write_markdown(path: str, content: str):
+    """Atomically replace path with content (blocking - run via asyncio.to_thread).
+    
+    The text is encoded in one go and written as bytes, skipping the text I/O layer.
+    """
+    with atomic_open(path) as f:
+        f.write(content.encode('utf-8'))
+
+class HostLimiter:
+    """Adaptive concurrency limit for one host (AIMD, like TCP congestion control).
+    
+    Starts at one request in flight, grows by about one per round of successful
+    requests up to max_concurrency, and halves when the host answers 429/5xx.
+    """
+    
+    def __init__(self, max_concurrency: int = 4):
+        self.max_concurrency = max_concurrency
+        self.limit = 1.0
+        self.active = 0
+        self._cond = asyncio.Condition()
+    
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+        return self
+    
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+    
+    def record(self, ok: bool):
+        """Feed back the outcome of a request."""
+        if ok:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(1.0, self.limit / 2)
+
+def crawl_retry_delay(attempt: int, result=None, base: float = 1.0, cap: float = 30.0) -> float:
+    """Exponential backoff with jitter, never shorter than the server's Retry-After."""
+    delay = min(base * 2 ** attempt + random.random(), cap)
+    headers = getattr(result, 'response_headers', None) or {}
+    retry_after = next((value for key, value in headers.items() if key.lower() == 'retry-after'), None)
+    if retry_after and str(retry_after).isdigit():
+        delay = max(delay, min(float(retry_after), cap))
+    return delay
+
 class GenericEcommerceCrawler:
     """Generic E-commerce Keyword Crawler for Japanese sites"""
     
-    def __init__(self, keywords: List[str], rakuten: bool = True, amazon: bool = True, yahoo: bool = True, aupay: bool = True, cosme: bool = True):
+    def __init__(self, keywords: List[str], rakuten: bool = True, amazon: bool = True, yahoo: bool = True, aupay: bool = True, cosme: bool = True, persist: bool = True):
         self.keywords = keywords
         self.results = {}
+        self.persist = persist  # write rakuten.md / URL files to disk
+        self.markdown_content = ""  # last saved markdown, handed to the next pipeline step
         
         # All available sites
         all_sites = {
@@ -59,8 +192,18 @@ class GenericEcommerceCrawler:
             logger.warning("⚠️ No sites selected! Defaulting to Rakuten only.")
             self.sites = {'rakuten': all_sites['rakuten']}
         
-    async def search_and_crawl_site(self, site_name: str, url_template: str, keyword: str) -> Dict:
-        """Search and crawl a specific e-commerce site for a keyword"""
+        # Each site is a different host with its own adaptive request limit
+        self.limiters = {site_name: HostLimiter() for site_name in self.sites}
+        self.max_retries = 3
+        
+    async def search_and_crawl_site(self, crawler: AsyncWebCrawler, site_name: str, url_template: str, keyword: str,
+                                    timestamp: str = None) -> Dict:
+        """Search and crawl a specific e-commerce site for a keyword using the shared crawler
+        
+        timestamp is the crawl batch's start time (taken now if not given) and is
+        stamped on the result whatever its outcome.
+        """
+        timestamp = timestamp or datetime.now().isoformat()
         try:
             # Encode keyword for URL
             encoded_keyword = quote(keyword)
@@ -69,40 +212,60 @@ class GenericEcommerceCrawler:
             logger.info(f"🔍 Searching {site_name} for keyword: {keyword}")
             logger.info(f"📍 URL: {search_url}")
             
-            async with AsyncWebCrawler() as crawler:
-                result = await crawler.arun(
-                    url=search_url,
-                    wait_for=3000,
-                    bypass_cache=True,
-                    headers={
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                        'Accept-Language': 'ja,en-US;q=0.9,en;q=0.8',
-                        'Accept-Encoding': 'gzip, deflate, br',
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
-                    }
-                )
+            limiter = self.limiters[site_name]
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with limiter:
+                        result = await crawler.arun(
+                            url=search_url,
+                            wait_for=3000,
+                            bypass_cache=True,
+                            headers={
+                                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                                'Accept-Language': 'ja,en-US;q=0.9,en;q=0.8',
+                                'Accept-Encoding': 'gzip, deflate, br',
+                                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+                            }
+                        )
+                except Exception as e:
+                    # Network-level failure: back off and retry like a 5xx
+                    limiter.record(False)
+                    if attempt == self.max_retries:
+                        raise
+                    delay = crawl_retry_delay(attempt)
+                    logger.warning(f"⏳ {site_name} request failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                
+                throttled = getattr(result, 'status_code', None) in RETRYABLE_STATUS
+                limiter.record(not throttled)
+                if not throttled or attempt == self.max_retries:
+                    break
+                delay = crawl_retry_delay(attempt, result)
+                logger.warning(f"⏳ {site_name} answered {result.status_code}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            
+            if result.success:
+                logger.info(f"✅ Successfully crawled {site_name} for {keyword}")
+                return {
+                    'site': site_name,
+                    'keyword': keyword,
+                    'url': search_url,
+                    'status': 'success',
+                    'markdown': result.markdown,
+                    'timestamp': timestamp
+                }
+            else:
+                logger.error(f"❌ Failed to crawl {site_name} for {keyword}: {result.error_message}")
+                return {
+                    'site': site_name,
+                    'keyword': keyword,
+                    'url': search_url,
+                    'status': 'failed',
+                    'error': result.error_message,
+                    'timestamp': timestamp
+                }
                 
-                if result.success:
-                    logger.info(f"✅ Successfully crawled {site_name} for {keyword}")
-                    return {
-                        'site': site_name,
-                        'keyword': keyword,
-                        'url': search_url,
-                        'status': 'success',
-                        'markdown': result.markdown,
-                        'timestamp': datetime.now().isoformat()
-                    }
-                else:
-                    logger.error(f"❌ Failed to crawl {site_name} for {keyword}: {result.error_message}")
-                    return {
-                        'site': site_name,
-                        'keyword': keyword,
-                        'url': search_url,
-                        'status': 'failed',
-                        'error': result.error_message,
-                        'timestamp': datetime.now().isoformat()
-                    }
-                    
         except Exception as e:
             logger.error(f"❌ Exception while crawling {site_name} for {keyword}: {e}")
             return {
@@ -111,54 +274,28 @@ class GenericEcommerceCrawler:
                 'url': search_url if 'search_url' in locals() else url_template,
                 'status': 'error',
                 'error': str(e),
-                'timestamp': datetime.now().isoformat()
+                'timestamp': timestamp
             }
     
     async def save_markdown_to_file(self, site_name: str, keyword: str, markdown_content: str):
-        """Save markdown content to rakuten.md AND extract URLs to TXT file"""
+        """Save markdown content to rakuten.md (URL extraction is markdown_product_url_extractor.py's job)"""
         try:
+            # Keep the latest markdown in memory for in-process pipeline runs
+            self.markdown_content = str(markdown_content)
+            if not self.persist:
+                return None
+            
             # ALWAYS save markdown content to rakuten.md (overwrite existing content)
+            # Off the event loop, so concurrent searches keep running during the write
             markdown_filename = "rakuten.md"
-            with open(markdown_filename, 'w', encoding='utf-8') as f:
-                f.write(markdown_content)
-            
-            print(f"💾 Saved markdown content to {markdown_filename}")
-            
-            # Also save URLs to TXT file for backward compatibility
-            filename = f"{site_name}_all_urls.txt"
-            
-            # Extract URLs from markdown content
-            extracted_urls = self.extract_urls_from_content(markdown_content, site_name)
-            
-            # OVERWRITE the file with simple text format (one URL per line)
-            with open(filename, 'w', encoding='utf-8') as f:
-                # Add header information as comments
-                f.write(f"# {site_name.upper()} Search Results\n")
-                f.write(f"# Site: {site_name}\n")
-                f.write(f"# Keyword: {keyword}\n")
-                f.write(f"# Search Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"# Total URLs: {len(extracted_urls)}\n")
-                f.write("# URLs extracted from markdown content:\n")
-                f.write("#" + "="*50 + "\n")
-                
-                # Write each URL on a separate line
-                for url in extracted_urls:
-                    f.write(f"{url}\n")
+            await asyncio.to_thread(write_markdown, markdown_filename, markdown_content)
             
-            logger.info(f"💾 Saved {len(extracted_urls)} URLs from {site_name} for '{keyword}' to: {filename}")
-            return filename
+            print(f"💾 Saved markdown content to {markdown_filename} ({site_name} / '{keyword}')")
+            return markdown_filename
             
         except Exception as e:
             logger.error(f"❌ Failed to save content for {site_name} - {keyword}: {e}")
             return None
-        except Exception as e:
-            logger.error(f"❌ Failed to save URLs for {site_name} - {keyword}: {e}")
-            return None
-    
-    def extract_urls_from_content(self, content: str, site_name: str) -> List[str]:
-        """Extract ALL URLs from markdown content - simple extraction without filtering"""
-        # For now, return empty list - URL extraction will be handled by markdown_product_url_extractor.py
-        return []
     
     async def crawl_all_sites(self) -> Dict:
         """Crawl all e-commerce sites for all keywords"""
@@ -167,25 +304,25 @@ class GenericEcommerceCrawler:
         logger.info(f"🛒 Sites: {', '.join(self.sites.keys())}")
         
         start_time = time.time()
+        batch_timestamp = datetime.now().isoformat()
         all_results = {}
         
-        for keyword in self.keywords:
-            logger.info(f"\n📝 Processing keyword: {keyword}")
-            keyword_results = {}
-            
-            for site_name, url_template in self.sites.items():
-                # Add delay between requests to be respectful
-                await asyncio.sleep(2)
-                
-                # Crawl the site
-                result = await self.search_and_crawl_site(site_name, url_template, keyword)
-                keyword_results[site_name] = result
-                
-                # Save markdown if successful
-                if result['status'] == 'success' and 'markdown' in result:
-                    await self.save_markdown_to_file(site_name, keyword, result['markdown'])
-            
-            all_results[keyword] = keyword_results
+        # Every search shares one browser; each site's HostLimiter decides how
+        # many of its searches are in flight at once
+        searches = [(keyword, site_name, url_template)
+                    for keyword in self.keywords
+                    for site_name, url_template in self.sites.items()]
+        
+        async with AsyncWebCrawler(config=create_search_browser_config()) as crawler:
+            results = await asyncio.gather(*(self.search_and_crawl_site(crawler, site_name, url_template, keyword,
+                                                                       batch_timestamp)
+                                             for keyword, site_name, url_template in searches))
+        
+        # Save in the original keyword/site order, so the same search wins rakuten.md as before
+        for (keyword, site_name, _), result in zip(searches, results):
+            all_results.setdefault(keyword, {})[site_name] = result
+            if result['status'] == 'success' and 'markdown' in result:
+                await self.save_markdown_to_file(site_name, keyword, result['markdown'])
         
         total_time = time.time() - start_time
         
@@ -194,7 +331,7 @@ class GenericEcommerceCrawler:
             'crawler_info': {
                 'type': 'generic_ecommerce_keyword_crawler',
                 'version': '1.0',
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': batch_timestamp,
                 'total_time_seconds': total_time
             },
             'keywords_processed': self.keywords,
@@ -227,27 +364,23 @@ class GenericEcommerceCrawler:
                 return None
             
             # Configure Gemini with new API key
-            genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-            model = genai.GenerativeModel(
+            configure_gemini(os.getenv('GOOGLE_API_KEY'))
+            generation_config = dict(
+                temperature=0.1,
+                top_p=0.8,
+                top_k=20,
+                max_output_tokens=4096
+            )
+            model = async_gemini_model(
                 'gemini-1.5-flash',  # Use the stable model name
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.1,
-                    top_p=0.8,
-                    top_k=20,
-                    max_output_tokens=4096
-                )
+                generation_config=genai.types.GenerationConfig(**generation_config)
             )
             
             logger.info("🚀 Starting FAST Gemini processing for rakuten.md")
             logger.info("🤖 Using new Gemini API key with Flash model")
             
-            # Read the markdown file
-            with open('rakuten.md', 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Process in 100-line chunks as you requested
-            lines = content.split('\n')
-            chunk_size = 100  # Your preferred chunk size
+            # Process in ~12k-character chunks (whole lines), streamed from the file
+            chunk_size = int(os.getenv('GEMINI_CHUNK_CHARS', '12000'))
             all_products = []
             
             # Detailed prompt template for proper product extraction
@@ -285,49 +418,63 @@ JSON Format Required:
 Extract from this ecommerce search content:
 """
             
-            # Process chunks sequentially
-            total_chunks = (len(lines) + chunk_size - 1) // chunk_size
-            logger.info(f"🚀 Processing {total_chunks} chunks sequentially...")
-            
-            for i in range(0, len(lines), chunk_size):
-                chunk = lines[i:i + chunk_size]
-                chunk_content = '\n'.join(chunk)
-                
-                if not chunk_content.strip():
-                    continue
+            # Chunk results from earlier runs, keyed by model + prompt + chunk text:
+            # an unchanged chunk yields the same products, so it skips Gemini
+            chunk_cache = ResultCache('gemini_search_chunks')
+            
+            # Up to 8 chunks are in flight at once (the shared rate limiter still
+            # paces the requests); results are collected in chunk order
+            semaphore = asyncio.Semaphore(8)
+            
+            async def process_chunk(chunk_num: int, chunk_content: str) -> List[Dict]:
+                cache_key = ResultCache.make_key(model.model_name, generation_config,
+                                                 prompt_template, chunk_content)
+                cached = chunk_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"♻️ Chunk {chunk_num}: {len(cached)} products (cached)")
+                    return cached
                 
-                chunk_num = i // chunk_size + 1
-                logger.info(f"🔄 Processing chunk {chunk_num}/{total_chunks}")
-                
-                try:
-                    response = model.generate_content(
-                        prompt_template + chunk_content,
-                        request_options={"timeout": 30}
-                    )
-                    
-                    if response.text:
-                        clean_response = response.text.strip()
-                        if clean_response.startswith('```json'):
-                            clean_response = clean_response[7:]
-                        if clean_response.endswith('```'):
-                            clean_response = clean_response[:-3]
-                        
-                        chunk_products = json.loads(clean_response.strip())
+                async with semaphore:
+                    logger.info(f"🔄 Processing chunk {chunk_num}")
+                    try:
+                        # Async client: every chunk shares one gRPC channel on this loop
+                        response = await generate_content_async(
+                            model,
+                            prompt_template + chunk_content,
+                            request_options={"timeout": 30}
+                        )
                         
-                        if isinstance(chunk_products, list):
-                            all_products.extend(chunk_products)
-                            logger.info(f"✅ Chunk {chunk_num}: {len(chunk_products)} products")
-                        else:
+                        if response.text:
+                            chunk_products = loads(strip_code_fence(response.text))
+                            
+                            if isinstance(chunk_products, list):
+                                logger.info(f"✅ Chunk {chunk_num}: {len(chunk_products)} products")
+                                chunk_cache.set(cache_key, chunk_products)
+                                return chunk_products
                             logger.warning(f"⚠️ Unexpected format in chunk {chunk_num}")
-                    
-                    await asyncio.sleep(0.5)
-                    
-                except json.JSONDecodeError as e:
-                    logger.error(f"❌ JSON error in chunk {chunk_num}: {e}")
-                    continue
-                except Exception as e:
-                    logger.error(f"❌ Error in chunk {chunk_num}: {e}")
-                    continue
+                        
+                    except ValueError as e:  # JSON decode error (json or orjson)
+                        logger.error(f"❌ JSON error in chunk {chunk_num}: {e}")
+                    except Exception as e:
+                        logger.error(f"❌ Error in chunk {chunk_num}: {e}")
+                    return []
+            
+            logger.info(f"🚀 Processing rakuten.md in ~{chunk_size}-character chunks concurrently...")
+            # Read the chunks on a worker thread, not the event loop
+            chunks = await asyncio.to_thread(list, chunked_text('rakuten.md', chunk_size))
+            product_chunks = [(chunk_num, chunk_content)
+                              for chunk_num, chunk_content in enumerate(chunks, 1)
+                              if PRODUCT_HINT_PATTERN.search(chunk_content)]
+            if len(product_chunks) < len(chunks):
+                logger.info(f"⏭️ Skipping {len(chunks) - len(product_chunks)} of {len(chunks)} chunks with no prices or product links")
+            chunk_results = await asyncio.gather(*(
+                process_chunk(chunk_num, chunk_content)
+                for chunk_num, chunk_content in product_chunks
+            ))
+            for chunk_products in chunk_results:
+                all_products.extend(chunk_products)
+            if chunk_cache.hits:
+                logger.info(f"♻️ Reused {chunk_cache.hits} cached chunks, {chunk_cache.misses} sent to Gemini")
             
             # ULTRA-AGGRESSIVE deduplication and merging
             logger.info("� Applying ULTRA-AGGRESSIVE deduplication...")
@@ -335,8 +482,7 @@ Extract from this ecommerce search content:
             
             # Save to JSON file
             output_file = 'rakuten.json'
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(unique_products, f, ensure_ascii=False, indent=2)
+            await asyncio.to_thread(write_json, output_file, unique_products)
             
             logger.info(f"💾 Saved {len(unique_products)} unique products to {output_file}")
             logger.info(f"📊 Removed {len(all_products) - len(unique_products)} duplicates/incomplete entries")
@@ -351,78 +497,47 @@ Extract from this ecommerce search content:
         try:
             logger.info(f"🔥 Starting with {len(products)} raw products")
             
-            # Strategy 1: Filter out obviously invalid/empty products
-            valid_products = []
+            # Single pass: drop products without a meaningful name, merge EXACT
+            # duplicates (same name + price, plus URL for Rakuten item pages) and
+            # keep variants. Keys are tuples, so no joined key strings are built.
+            unique_products = {}
+            
             for product in products:
                 if not isinstance(product, dict):
                     continue
                 
-                name = str(product.get('Product_Name', '')).strip()
-                price = str(product.get('Price', '')).strip()
-                desc = str(product.get('Product_Description', '')).strip()
-                
-                # Skip if no meaningful data
-                if (not name or name.lower() in ['null', 'none', '']) and \
-                   (not price or price.lower() in ['null', 'none', '']) and \
-                   (not desc or desc.lower() in ['null', 'none', '']):
+                # Each field is stripped and casefolded once per product
+                name = field_text(product, 'Product_Name')
+                name_folded = name.casefold()
+                # Keep products with meaningful names (allow 2 chars for Japanese)
+                if len(name) < 2 or name_folded in NULL_VALUES:
                     continue
                 
-                # Skip if name is just a number or too short (but allow 2 chars for Japanese)
-                if name and len(name) < 2:
+                price = field_text(product, 'Price')
+                if price.casefold() in NULL_VALUES:
+                    # Product without enough data for comparison - keep it anyway
+                    unique_products[(None, len(unique_products))] = product
                     continue
                 
-                valid_products.append(product)
-            
-            logger.info(f"🔄 After filtering invalid: {len(valid_products)} products")
-            
-            # Strategy 2: Smart grouping - only merge EXACT duplicates, keep variants
-            exact_duplicates = {}
-            
-            for product in valid_products:
-                name = str(product.get('Product_Name', '')).strip().lower()
-                price = str(product.get('Price', '')).strip()
-                url = str(product.get('Web_URL', '')).strip()
+                url = field_text(product, 'Web_URL')
+                exact_key = (name_folded, price,
+                             url if 'item.rakuten.co.jp' in url and url.casefold() not in NULL_VALUES else None)
                 
-                # Create exact match key - name + price + URL for precise duplicate detection
-                exact_key = None
-                
-                if name and price and price.lower() not in ['null', 'none', '']:
-                    # Use name + price for exact matching
-                    exact_key = f"{name}|{price}"
-                    
-                    # If we also have URL, make it even more specific
-                    if url and url.lower() not in ['null', 'none', ''] and 'item.rakuten.co.jp' in url:
-                        exact_key = f"{name}|{price}|{url}"
-                
-                if exact_key and exact_key in exact_duplicates:
+                existing = unique_products.get(exact_key)
+                if existing is not None:
                     # True duplicate found - merge data
-                    existing = exact_duplicates[exact_key]
-                    merged = self._merge_product_data(existing, product)
-                    exact_duplicates[exact_key] = merged
-                elif exact_key:
-                    # New unique product
-                    exact_duplicates[exact_key] = product
+                    unique_products[exact_key] = self._merge_product_data(existing, product)
                 else:
-                    # Product without enough data for comparison - keep it anyway
-                    # Use a unique key based on index to avoid losing it
-                    fallback_key = f"fallback_{len(exact_duplicates)}"
-                    exact_duplicates[fallback_key] = product
+                    unique_products[exact_key] = product
             
-            logger.info(f"🔄 After exact duplicate removal: {len(exact_duplicates)} unique products")
+            logger.info(f"🔄 After filtering and exact duplicate removal: {len(unique_products)} unique products")
             
-            # Strategy 3: Final quality filter - keep more products
-            final_products = []
-            for product in exact_duplicates.values():
-                name = str(product.get('Product_Name', '')).strip()
-                
-                # More lenient criteria - keep products with meaningful names
-                if name and len(name) >= 2 and name.lower() not in ['null', 'none', '']:
-                    # Clean up the product data
-                    cleaned_product = self._clean_product_data(product)
-                    final_products.append(cleaned_product)
+            # Clean up the product data
+            final_products = [self._clean_product_data(product) for product in unique_products.values()]
             
-            # Sort by name for consistent output
-            final_products.sort(key=lambda x: str(x.get('Product_Name', '')).lower())
+            # Sort by name for consistent output (names are already cleaned strings;
+            # list.sort computes each key once, so casefold runs once per product)
+            final_products.sort(key=lambda x: (x.get('Product_Name') or '').casefold())
             
             logger.info(f"🎯 FINAL RESULT: {len(final_products)} unique products (kept more variants)")
             return final_products
@@ -433,30 +548,11 @@ Extract from this ecommerce search content:
 
     def _extract_core_name(self, name):
         """Extract core product name by removing size/color/variation indicators"""
-        import re
-        
-        # Convert to lower case for processing
-        core = name.lower()
-        
-        # Remove common size indicators
-        core = re.sub(r'\b\d+\s*(ml|g|kg|oz|lb|l|liter|gram|kilogram)\b', '', core)
-        core = re.sub(r'\b\d+\s*[×x]\s*\d+\b', '', core)  # dimensions
-        core = re.sub(r'\b\d+\s*個\b', '', core)  # Japanese count
-        core = re.sub(r'\b\d+\s*本\b', '', core)  # Japanese count
-        
-        # Remove color indicators
-        color_words = ['black', 'white', 'red', 'blue', 'green', 'yellow', 'pink', 'purple', 'gray', 'grey', 'brown']
-        for color in color_words:
-            core = re.sub(rf'\b{color}\b', '', core)
-        
-        # Remove parenthetical information
-        core = re.sub(r'\([^)]*\)', '', core)
-        core = re.sub(r'\[[^\]]*\]', '', core)
+        # Lower-case, then remove bracketed notes, colors and sizes in one pass
+        core = VARIATION_PATTERN.sub('', name.lower())
         
         # Clean up extra spaces
-        core = ' '.join(core.split())
-        
-        return core.strip()
+        return ' '.join(core.split())
 
     def _clean_product_data(self, product):
         """Clean up product data removing null/empty values"""
@@ -530,97 +626,82 @@ Extract from this ecommerce search content:
             return products  # Return original if deduplication fails
 
     def _merge_product_data(self, existing, new):
-        """Merge two product dictionaries, preferring non-null/non-empty values"""
+        """Merge new into existing in place, preferring non-null/non-empty values; returns existing"""
         try:
-            merged = existing.copy()
-            
             for key, value in new.items():
                 # Skip if new value is null, empty, or 'null' string
                 if value is None or value == '' or value == 'null':
                     continue
                 
                 # If existing value is null/empty, use new value
-                existing_value = merged.get(key)
-                if (existing_value is None or existing_value == '' or 
-                    existing_value == 'null' or str(existing_value).strip() == ''):
-                    merged[key] = value
+                existing_value = existing.get(key)
+                if existing_value is None or existing_value == 'null':
+                    existing[key] = value
+                    continue
+                existing_text = existing_value if type(existing_value) is str else str(existing_value)
+                if not existing_text.strip():
+                    existing[key] = value
                     continue
                 
                 # For specific fields, prefer longer/more detailed values
-                if key in ['Product_Description', 'Brand_Description', 'Full_Ingredient_List', 
-                          'Marketing_Materials', 'Packaging_Information', 'New_Feature_Promotion']:
-                    if len(str(value)) > len(str(existing_value)):
-                        merged[key] = value
+                if key in LONGEST_WINS_FIELDS:
+                    if len(value if type(value) is str else str(value)) > len(existing_text):
+                        existing[key] = value
                 
                 # For URLs, prefer actual item URLs over search URLs
                 elif key == 'Web_URL':
-                    if 'item.rakuten.co.jp' in str(value) and 'search.rakuten.co.jp' in str(existing_value):
-                        merged[key] = value
-                    elif 'item.rakuten.co.jp' not in str(existing_value) and 'item.rakuten.co.jp' in str(value):
-                        merged[key] = value
+                    value_text = str(value)
+                    if 'item.rakuten.co.jp' in value_text and ('search.rakuten.co.jp' in existing_text or
+                                                               'item.rakuten.co.jp' not in existing_text):
+                        existing[key] = value
                 
                 # For other fields, keep existing if both have values
-                # Could add more sophisticated merging logic here if needed
                 
-            return merged
+            return existing
             
         except Exception as e:
             logger.error(f"❌ Error merging product data: {e}")
             return existing
 
-async def main():
-    """Main function to run the generic e-commerce crawler"""
+async def main(persist: bool = True, keywords: str = None, sites: str = None) -> str:
+    """Main function to run the generic e-commerce crawler; returns the saved markdown
+    
+    Keywords and sites (comma-separated) come from the arguments, then the
+    ECOMMERCE_KEYWORDS / ECOMMERCE_SITES environment variables; the terminal
+    prompts are only a fallback when stdin is interactive.
+    """
+    interactive = sys.stdin is not None and sys.stdin.isatty()
     
-    # Ask for keywords in terminal prompt
     try:
         print("🔑 E-commerce Keyword Crawler")
-        print("Enter keywords (comma-separated):")
-        keywords_input = input("Keywords: ").strip()
+        keywords_input = (keywords or os.getenv('ECOMMERCE_KEYWORDS', '')).strip()
+        if not keywords_input and interactive:
+            print("Enter keywords (comma-separated):")
+            keywords_input = input("Keywords: ").strip()
         
         if not keywords_input:
             print("❌ No keywords provided!")
-            return
+            return ""
             
         keywords = [kw.strip() for kw in keywords_input.split(',') if kw.strip()]
         print(f"🔑 Using keywords: {', '.join(keywords)}")
         
-        # Ask for site selection
-        print("\n🌐 Enter websites to crawl:")
-        print("Enter one per line (press Enter on empty line to finish):")
-        
         sites_to_crawl = set()
         
-        def normalize_site_name(site_input):
-            """Normalize various site input formats to standard names"""
-            site_lower = site_input.lower().strip()
-            
-            # Rakuten variations
-            if any(keyword in site_lower for keyword in ['rakuten', 'item.rakuten', 'search.rakuten']):
-                return 'rakuten'
-            
-            # Amazon variations  
-            elif any(keyword in site_lower for keyword in ['amazon', 'amazon.co.jp', 'amazon.com']):
-                return 'amazon'
-            
-            # Yahoo variations
-            elif any(keyword in site_lower for keyword in ['yahoo', 'shopping.yahoo', 'yahoo.co.jp']):
-                return 'yahoo'
-            
-            # AU PAY variations
-            elif any(keyword in site_lower for keyword in ['aupay', 'au pay', 'wowma', 'au.com']):
-                return 'aupay'
-            
-            # Cosme variations
-            elif any(keyword in site_lower for keyword in ['cosme', 'cosmeet.cosme', 'cosme.net']):
-                return 'cosme'
-            
-            return None
+        # Ask for site selection (unless preset on the command line or by the pipeline)
+        preset_sites = sites or os.getenv('ECOMMERCE_SITES', '')
+        site_inputs = [site.strip() for site in preset_sites.split(',') if site.strip()]
+        if not site_inputs and interactive:
+            print("\n🌐 Enter websites to crawl:")
+            print("Enter one per line (press Enter on empty line to finish):")
+            
+            while True:
+                site_input = input("Website: ").strip()
+                if not site_input:
+                    break
+                site_inputs.append(site_input)
         
-        while True:
-            site_input = input("Website: ").strip()
-            if not site_input:
-                break
-            
+        for site_input in site_inputs:
             normalized_site = normalize_site_name(site_input)
             
             if normalized_site:
@@ -646,7 +727,7 @@ async def main():
         
     except (EOFError, KeyboardInterrupt):
         print("\n❌ Input cancelled!")
-        return
+        return ""
     
     print(f"\n🚀 Starting crawl with keywords: {', '.join(keywords)}")
     
@@ -657,7 +738,8 @@ async def main():
         amazon=amazon_enabled,
         yahoo=yahoo_enabled,
         aupay=aupay_enabled,
-        cosme=cosme_enabled
+        cosme=cosme_enabled,
+        persist=persist
     )
     results = await crawler.crawl_all_sites()
     
@@ -667,17 +749,23 @@ async def main():
     print(f"  • Sites searched: {results['stats']['total_sites']}")
     print(f"  • Successful searches: {results['stats']['successful_searches']}")
     print(f"  • Failed searches: {results['stats']['failed_searches']}")
+    if persist:
+        print(f"  • Markdown saved to: rakuten.md")
     
-    # Show only the files that were created
-    created_files = []
-    if rakuten_enabled: created_files.append("rakuten_all_urls.txt")
-    if amazon_enabled: created_files.append("amazon_all_urls.txt")
-    if yahoo_enabled: created_files.append("yahoo_all_urls.txt")
-    if aupay_enabled: created_files.append("aupay_all_urls.txt")
-    if cosme_enabled: created_files.append("cosme_all_urls.txt")
+    return crawler.markdown_content
+
+def run(input_obj=None, persist: bool = True) -> str:
+    """Pipeline entrypoint: crawl the selected sites and return the markdown content.
     
-    print(f"  • Website URL files: {', '.join(created_files)}")
-    print(f"  • Each TXT file contains extracted URLs for that site")
+    The first step has no upstream input, so input_obj is ignored.
+    """
+    return asyncio.run(main(persist=persist))
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Generic Ecommerce Keyword Crawler")
+    parser.add_argument("--keywords",
+                        help="comma-separated search keywords (prompted for when omitted on a terminal)")
+    parser.add_argument("--sites",
+                        help="comma-separated sites, e.g. rakuten,amazon (default: prompt, or rakuten)")
+    args = parser.parse_args()
+    asyncio.run(main(keywords=args.keywords, sites=args.sites))
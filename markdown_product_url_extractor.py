@@ -6,13 +6,19 @@ This is more accurate than regex extraction as it uses AI to identify actual pro
 Uses Gemini for AI-powered URL extraction with website analysis
 """                                                                               
 
-import json
+import asyncio
+import mmap
 import os
-import time
-from typing import List, Dict, Any
+import re
+from contextlib import aclosing
+from typing import List, Dict, Any, Callable, Optional, Union
 import google.generativeai as genai
 from datetime import datetime
 from dotenv import load_dotenv
+from pipeline_cache import ResultCache
+from pipeline_http import async_gemini_model, configure_gemini, generate_content_async
+from pipeline_io import loads, write_json, write_jsonl
+from pipeline_urls import host_and_path, is_candidate_product_url, is_known_product_url, url_template
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +28,41 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 # Force use the correct model name regardless of environment variable
 GEMINI_MODEL_NAME = 'gemini-2.5-flash-lite'
 
+# Every http(s) URL in the markdown, up to whitespace, a closing paren/quote or
+# an angle bracket. The class is negated and there is a single quantifier, so
+# the scan is one linear pass (and runs in C, far faster than a find() loop).
+URL_PATTERN = re.compile(r'https?://[^\s)"<>]+')
+# The same scan over raw UTF-8 bytes (a memory-mapped file)
+URL_BYTES_PATTERN = re.compile(rb'https?://[^\s)"<>]+')
+# Punctuation that trails URLs in prose/markdown
+URL_TRAILING_PUNCTUATION = '.,;:!?"\')'
+
+# Structured output for URL classification: Gemini must answer with exactly
+# {"product_url_numbers": [1, 5, ...]}, so no fence stripping or format guessing
+URL_NUMBERS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "product_url_numbers": {"type": "array", "items": {"type": "integer"}}
+    },
+    "required": ["product_url_numbers"]
+}
+
+# Candidate URLs written to product_urls_debug.json (EXTRACT_DEBUG runs only)
+DEBUG_SAMPLE_SIZE = 1000
+
+def find_urls(content: Union[str, bytes, mmap.mmap]) -> List[str]:
+    """Every http(s) URL in content: text, or the UTF-8 bytes of a mapped file."""
+    if isinstance(content, str):
+        return URL_PATTERN.findall(content) if '://' in content else []
+    # For bytes \s only means ASCII whitespace, so each decoded match is scanned
+    # again to also split at Unicode whitespace (e.g. U+3000) like the text scan
+    return [url for match in URL_BYTES_PATTERN.finditer(content)
+            for url in URL_PATTERN.findall(match.group().decode('utf-8', 'replace'))]
+
+def describe_size(content: Union[str, mmap.mmap]) -> str:
+    """"1,234 characters" for text, "1,234 bytes" for a mapped file."""
+    return f"{len(content):,} {'characters' if isinstance(content, str) else 'bytes'}"
+
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in environment variables")
 
@@ -29,11 +70,22 @@ class MarkdownProductURLExtractor:
     def __init__(self):
         """Initialize the markdown product URL extractor with Gemini."""
         # Configure Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        configure_gemini(GEMINI_API_KEY)
         
         print(f"🤖 Initialized with Gemini model: {GEMINI_MODEL_NAME}")
         
+        # Gemini calls in flight at once while classifying URL chunks
+        self.max_chunks_per_batch = 10
+        
+        # URL chunk size: as many URLs per request as fit the prompt budget (the
+        # answer is just index numbers), capped so one bad response loses little
+        self.max_prompt_tokens = 200_000
+        self.max_urls_per_chunk = 500
+        
+        # Product / not-product verdicts per URL template from earlier runs
+        # (see pipeline_cache.py), so URLs seen before never go back to Gemini
+        self.verdicts = ResultCache('gemini_url_verdicts')
+        
         # Enhanced prompt with website analysis for better product URL extraction
         self.extraction_prompt = """You are an expert e-commerce website analyzer and product URL extractor.
 
@@ -80,14 +132,45 @@ Return your response as valid JSON with this exact structure:
 }}
 
 Be thorough and comprehensive - missing product URLs means lost business opportunities!"""
+        
+        # Prompt for classifying one chunk of (sanitized, numbered) URLs; only
+        # url_count and urls_text change per chunk
+        self.chunk_prompt = """You are analyzing e-commerce URLs to identify product pages.
+
+TASK: Review these {url_count} URLs and identify which ones are individual product pages.
 
-    def load_markdown_file(self, file_path: str) -> str:
-        """Load markdown content from file."""
+CRITERIA for product pages:
+✅ URLs that show individual items for sale
+✅ Have specific product identifiers (like /dp/, /item/, /product/)
+✅ Lead to pages where customers can purchase items
+✅ Display specific product details
+
+EXCLUDE:
+❌ Search results or category pages
+❌ Navigation or account pages
+❌ Media files or resources
+
+URL LIST:
+{urls_text}
+
+Return only the numbers (1, 2, 3, etc.) of URLs that are product pages.
+Output as JSON: {{"product_url_numbers": [1, 5, 8, ...]}}"""
+
+    def load_markdown_file(self, file_path: str) -> Union[mmap.mmap, str]:
+        """Map markdown file read-only ("" if it's missing or empty).
+        
+        Only the URLs are ever decoded, so the file is scanned as bytes straight
+        from the page cache instead of being copied into a (2-4x larger) str.
+        The mapping closes when the last reference to it goes away.
+        """
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
+            with open(file_path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    print(f"❌ File is empty: {file_path}")
+                    return ""
+                content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
                 print(f"✅ Loaded markdown file: {file_path}")
-                print(f"📄 Content length: {len(content):,} characters")
+                print(f"📄 Content length: {len(content):,} bytes")
                 return content
         except FileNotFoundError:
             print(f"❌ File not found: {file_path}")
@@ -101,219 +184,307 @@ Be thorough and comprehensive - missing product URLs means lost business opportu
         # Return the entire content as a single "chunk"
         return [content] if content.strip() else []
 
-    def extract_urls_from_content(self, content: str) -> List[str]:
-        """Extract product URLs by first getting all URLs, then filtering with AI."""
+    def extract_urls_from_content(self, content: Union[str, mmap.mmap],
+                                  on_product_urls: Callable[[List[str]], None] = None) -> List[str]:
+        """Extract product URLs by first getting all URLs, then filtering with AI.
+        
+        on_product_urls, if given, is called with each chunk's product URLs as soon
+        as that chunk is classified (used by the streaming pipeline).
+        """
         try:
-            print(f"🔄 Processing entire file ({len(content):,} characters)...")
+            print(f"🔄 Processing entire file ({describe_size(content)})...")
             
             # Step 1: Extract ALL HTTP(S) URLs from markdown using regex
-            import re
             print("🔗 Extracting all HTTP(S) URLs from content...")
-            raw_urls = re.findall(r'https?://[^\s)"<>]+', content)
+            raw_urls = find_urls(content)
+            
+            # Step 2: Clean trailing punctuation and deduplicate, preserving order
+            unique_urls = list(dict.fromkeys(url.rstrip(URL_TRAILING_PUNCTUATION) for url in raw_urls))
             
-            # Step 2: Deduplicate while preserving order
-            seen = set()
-            all_urls = []
-            for url in raw_urls:
-                clean_url = url.rstrip('.,;:!?"\')')  # Clean trailing punctuation
-                if clean_url not in seen:
-                    seen.add(clean_url)
-                    all_urls.append(clean_url)
+            # Images, scripts and search/category/account/help pages never need Gemini
+            all_urls = [url for url in unique_urls if is_candidate_product_url(url)]
             
-            print(f"📊 Found {len(raw_urls)} total URLs, {len(all_urls)} unique URLs")
+            print(f"📊 Found {len(raw_urls)} total URLs, {len(unique_urls)} unique URLs")
+            print(f"🧹 Skipped {len(unique_urls) - len(all_urls)} asset/navigation URLs, {len(all_urls)} left to classify")
             
             if not all_urls:
                 print("❌ No URLs found in content")
                 return []
             
-            # 🐛 DEBUG: Save all URLs before sending to GPT-4o
-            debug_data = {
-                "extraction_timestamp": datetime.now().isoformat(),
-                "total_raw_urls": len(raw_urls),
-                "unique_urls_count": len(all_urls),
-                "all_candidate_urls": all_urls
-            }
+            # 🐛 DEBUG: Save the candidate URLs (a sample, plus counts) before sending
+            # them to Gemini - only when EXTRACT_DEBUG is set
+            if os.getenv('EXTRACT_DEBUG'):
+                debug_data = {
+                    "extraction_timestamp": datetime.now().isoformat(),
+                    "total_raw_urls": len(raw_urls),
+                    "unique_urls_count": len(unique_urls),
+                    "candidate_urls_count": len(all_urls),
+                    "all_candidate_urls": all_urls[:DEBUG_SAMPLE_SIZE]
+                }
+                
+                write_json('product_urls_debug.json', debug_data)
+                print(f"🐛 DEBUG: Saved {len(debug_data['all_candidate_urls'])} of {len(all_urls)} "
+                      f"candidate URLs to product_urls_debug.json")
+                
+                # 🐛 DEBUG: Show first 10 URLs being sent to Gemini
+                print(f"🐛 DEBUG: First 10 URLs being sent to Gemini:")
+                for i, url in enumerate(all_urls[:10]):
+                    print(f"   {i+1}. {url}")
+                if len(all_urls) > 10:
+                    print(f"   ... and {len(all_urls) - 10} more URLs")
             
-            with open('product_urls_debug.json', 'w', encoding='utf-8') as f:
-                json.dump(debug_data, f, indent=2, ensure_ascii=False)
-            print(f"🐛 DEBUG: Saved {len(all_urls)} candidate URLs to product_urls_debug.json")
+            # Step 3: URLs in a site's known product-page scheme (e.g. Amazon /dp/,
+            # Rakuten item pages) are accepted outright; Gemini only sees the rest
+            known_product_urls = []
+            ambiguous_urls = []
+            for url in all_urls:
+                if is_known_product_url(url):
+                    known_product_urls.append(url)
+                else:
+                    ambiguous_urls.append(url)
+            print(f"✅ {len(known_product_urls)} URLs match known product-page patterns, "
+                  f"{len(ambiguous_urls)} left for Gemini")
+            if on_product_urls and known_product_urls:
+                on_product_urls(known_product_urls)
             
-            # 🐛 DEBUG: Show first 10 URLs being sent to GPT-4o
-            print(f"🐛 DEBUG: First 10 URLs being sent to GPT-4o:")
-            for i, url in enumerate(all_urls[:10]):
-                print(f"   {i+1}. {url}")
-            if len(all_urls) > 10:
-                print(f"   ... and {len(all_urls) - 10} more URLs")
+            # Step 4: URLs that share a path template (only IDs differ) are the same
+            # kind of page, so Gemini classifies one representative per template
+            # and the verdict is applied to the whole group
+            groups = {}
+            for url in ambiguous_urls:
+                groups.setdefault(url_template(url), []).append(url)
             
-            # Step 3: Process URLs in chunks of 50 for better performance and fewer safety issues
-            chunk_size = 50
-            all_product_urls = []
+            def expand(urls: List[str]) -> List[str]:
+                return [member for url in urls for member in groups.get(url_template(url), [url])]
             
-            print(f"🔄 Processing {len(all_urls)} URLs in chunks of {chunk_size}...")
+            # Templates classified by an earlier run reuse that verdict
+            verdicts = {template: self.verdicts.get(self.verdict_key(template)) for template in groups}
+            cached_product_urls = [url for template, urls in groups.items() if verdicts[template] for url in urls]
+            representatives = [urls[0] for template, urls in groups.items() if verdicts[template] is None]
+            if len(representatives) < len(groups):
+                print(f"♻️ {len(groups) - len(representatives)} URL templates classified by earlier runs "
+                      f"({len(cached_product_urls)} product URLs)")
+                if on_product_urls and cached_product_urls:
+                    on_product_urls(cached_product_urls)
             
-            for i in range(0, len(all_urls), chunk_size):
-                chunk_urls = all_urls[i:i + chunk_size]
-                chunk_num = (i // chunk_size) + 1
-                total_chunks = (len(all_urls) + chunk_size - 1) // chunk_size
-                
-                print(f"📦 Processing chunk {chunk_num}/{total_chunks} ({len(chunk_urls)} URLs)...")
-                
-                # Create chunk data for GPT-4o
-                chunk_data = {
-                    "chunk_info": {
-                        "chunk_number": chunk_num,
-                        "total_chunks": total_chunks,
-                        "urls_in_chunk": len(chunk_urls)
-                    },
-                    "urls": chunk_urls
-                }
-                
-                # Enhanced prompt with safer URL handling to avoid safety filters
-                # Instead of sending raw URLs, we'll sanitize them better
-                url_descriptions = []
-                for j, url in enumerate(chunk_urls, 1):
-                    # More aggressive sanitization to avoid safety filters
-                    clean_url = url.split('?')[0]  # Remove query parameters
-                    clean_url = clean_url.split('#')[0]  # Remove fragments
-                    # Further sanitize by removing potentially problematic path components
-                    if '/ref=' in clean_url:
-                        clean_url = clean_url.split('/ref=')[0]
-                    url_descriptions.append(f"{j}. {clean_url}")
-                
-                urls_text = "\n".join(url_descriptions)
+            # Step 5: Pack representatives into as few requests as the token budget allows
+            all_product_urls = known_product_urls + cached_product_urls
+            chunks = self.pack_url_chunks(representatives)
+            
+            print(f"🔄 Processing {len(representatives)} URL templates (covering {len(ambiguous_urls)} URLs) "
+                  f"in {len(chunks)} chunks...")
+            
+            # Chunks are independent, so they are classified concurrently on an
+            # event loop of our own (callers run this method on a worker thread)
+            results = asyncio.run(self.classify_url_chunks(
+                chunks, on_product_urls and (lambda urls: on_product_urls(expand(urls)))
+            ))
+            results = [expand(urls) if urls else urls for urls in results]
+            for chunk_product_urls in results:
+                if chunk_product_urls:
+                    all_product_urls.extend(chunk_product_urls)
+            
+            print(f"🎯 Total product URLs found across all chunks: {len(all_product_urls)}")
+            
+            # Final deduplication and cleaning (chunks may overlap in what they return)
+            unique_product_urls = sorted(set(all_product_urls))
+            
+            print(f"🧹 After deduplication: {len(unique_product_urls)} unique product URLs")
+            return unique_product_urls
                 
-                prompt = f"""You are analyzing e-commerce URLs to identify product pages.
+        except Exception as e:
+            print(f"❌ API error: {str(e)}")
+            return []
 
-TASK: Review these {len(chunk_urls)} URLs and identify which ones are individual product pages.
+    @staticmethod
+    def verdict_key(template: str) -> str:
+        """Cache key for a URL template's product / not-product verdict."""
+        return ResultCache.make_key(GEMINI_MODEL_NAME, template)
 
-CRITERIA for product pages:
-✅ URLs that show individual items for sale
-✅ Have specific product identifiers (like /dp/, /item/, /product/)
-✅ Lead to pages where customers can purchase items
-✅ Display specific product details
+    def store_verdicts(self, chunk_urls: List[str], chunk_product_urls: List[str]):
+        """Remember which of a classified chunk's URL templates are product pages."""
+        product_templates = {url_template(url) for url in chunk_product_urls}
+        self.verdicts.set_many((self.verdict_key(url_template(url)), url_template(url) in product_templates)
+                               for url in chunk_urls)
 
-EXCLUDE:
-❌ Search results or category pages
-❌ Navigation or account pages
-❌ Media files or resources
+    def pack_url_chunks(self, urls: List[str]) -> List[List[str]]:
+        """Split urls greedily into chunks under max_prompt_tokens / max_urls_per_chunk.
+        
+        Tokens are estimated as ~4 characters each plus a few for the "N. " prefix
+        and newline; the estimate uses the full URL, so the sanitized prompt is smaller.
+        URLs are grouped by host first (hosts in first-seen order), so each chunk
+        shows Gemini one site's URL scheme at a time in multi-site markdown.
+        """
+        by_host = {}
+        for url in urls:
+            by_host.setdefault(host_and_path(url)[0], []).append(url)
+        
+        chunks = []
+        chunk = []
+        chunk_tokens = 0
+        for url in (url for host_urls in by_host.values() for url in host_urls):
+            url_tokens = len(url) // 4 + 3
+            if chunk and (chunk_tokens + url_tokens > self.max_prompt_tokens or
+                          len(chunk) >= self.max_urls_per_chunk):
+                chunks.append(chunk)
+                chunk = []
+                chunk_tokens = 0
+            chunk.append(url)
+            chunk_tokens += url_tokens
+        if chunk:
+            chunks.append(chunk)
+        return chunks
 
-URL LIST:
-{urls_text}
+    async def classify_url_chunks(self, chunks: List[List[str]],
+                                  on_product_urls: Callable[[List[str]], None] = None) -> List[Optional[List[str]]]:
+        """Classify every chunk concurrently; results come back in chunk order.
+        
+        Up to max_chunks_per_batch calls are in flight at once, and the shared
+        rate limiter still caps requests per minute.
+        """
+        semaphore = asyncio.Semaphore(self.max_chunks_per_batch)
+        # One model per run, built on this run's event loop (its channel is tied to it)
+        model = async_gemini_model(GEMINI_MODEL_NAME)
+        
+        async def classify(chunk_num: int, chunk_urls: List[str]) -> Optional[List[str]]:
+            async with semaphore:
+                return await self.classify_url_chunk(model, chunk_urls, chunk_num, len(chunks), on_product_urls)
+        
+        return await asyncio.gather(*(classify(chunk_num, chunk_urls)
+                                      for chunk_num, chunk_urls in enumerate(chunks, 1)))
 
-Return only the numbers (1, 2, 3, etc.) of URLs that are product pages.
-Output as JSON: {{"product_url_numbers": [1, 5, 8, ...]}}"""
+    async def read_response_stream(self, response, chunk_num: int) -> Optional[str]:
+        """Collect a streamed response's text, or None if it's blocked, empty or clearly not JSON."""
+        # aclosing: returning early closes the stream, which stops the generation
+        async with aclosing(aiter(response)) as chunks:
+            return await self._read_response_text(chunks, chunk_num)
 
-                print(f"🤖 Sending chunk {chunk_num} ({len(chunk_urls)} URLs) to Gemini...")
-                print(f"🐛 DEBUG: Chunk prompt length: {len(prompt)} characters")
-                
-                try:
-                    # Step 4: Call Gemini API to filter product URLs for this chunk
-                    response = self.model.generate_content(
-                        prompt,
-                        generation_config=genai.types.GenerationConfig(
-                            temperature=0.1,
-                            max_output_tokens=8192,
-                            response_mime_type="application/json"
-                        )
-                    )
-                    
-                    # Handle safety filter issues - if blocked, skip this chunk
-                    if not response.candidates or len(response.candidates) == 0:
-                        print(f"⚠️ Chunk {chunk_num}: No candidates returned, skipping this chunk...")
-                        continue
-                        
-                    candidate = response.candidates[0]
-                    if candidate.finish_reason == 2:  # SAFETY
-                        print(f"⚠️ Chunk {chunk_num}: Response blocked by safety filters, skipping this chunk...")
-                        continue
-                    
-                    if not response.text:
-                        print(f"⚠️ Chunk {chunk_num}: Empty response, skipping this chunk...")
-                        continue
-                        
-                    response_text = response.text.strip()
-                    print(f"🐛 DEBUG: Gemini chunk {chunk_num} response length: {len(response_text)} characters")
-                    
-                    # Step 5: Parse JSON response for this chunk
-                    try:
-                        # Clean the response (remove any markdown formatting)
-                        if response_text.startswith('```'):
-                            lines = response_text.split('\n')
-                            json_lines = [line for line in lines if not line.strip().startswith('```')]
-                            response_text = '\n'.join(json_lines).strip()
-                        
-                        # Parse JSON
-                        data = json.loads(response_text)
-                        
-                        if isinstance(data, dict) and 'product_url_numbers' in data:
-                            # Get the URLs based on the returned numbers
-                            url_numbers = data['product_url_numbers']
-                            chunk_product_urls = []
-                            for num in url_numbers:
-                                if 1 <= num <= len(chunk_urls):
-                                    chunk_product_urls.append(chunk_urls[num - 1])  # Convert to 0-based index
-                            
-                            print(f"✅ Chunk {chunk_num}: Found {len(chunk_product_urls)} product URLs")
-                            all_product_urls.extend(chunk_product_urls)
-                        elif isinstance(data, dict) and 'product_urls' in data:
-                            # Fallback to old format if returned
-                            chunk_product_urls = data['product_urls']
-                            print(f"✅ Chunk {chunk_num}: Found {len(chunk_product_urls)} product URLs")
-                            all_product_urls.extend(chunk_product_urls)
-                        elif isinstance(data, list):
-                            print(f"✅ Chunk {chunk_num}: Found {len(data)} product URLs")
-                            all_product_urls.extend(data)
-                        else:
-                            print(f"⚠️ Chunk {chunk_num}: Unexpected response format")
-                            print(f"Response keys: {list(data.keys()) if isinstance(data, dict) else 'Not a dict'}")
-                            
-                    except json.JSONDecodeError as e:
-                        print(f"❌ Chunk {chunk_num} JSON parsing error: {str(e)}")
-                        print(f"Response preview: {response_text[:200]}...")
-                        
-                except Exception as e:
-                    print(f"❌ Chunk {chunk_num} API error: {str(e)}")
-                
-                # Add small delay between chunks to avoid rate limits
-                if chunk_num < total_chunks:
-                    time.sleep(2)
-            
-            print(f"🎯 Total product URLs found across all chunks: {len(all_product_urls)}")
+    async def _read_response_text(self, chunks, chunk_num: int) -> Optional[str]:
+        parts = []
+        opened = False
+        async for chunk in chunks:
+            # Handle safety filter issues - if blocked, skip this chunk
+            if not chunk.candidates:
+                print(f"⚠️ Chunk {chunk_num}: No candidates returned, skipping this chunk...")
+                return None
+            if chunk.candidates[0].finish_reason == 2:  # SAFETY
+                print(f"⚠️ Chunk {chunk_num}: Response blocked by safety filters, skipping this chunk...")
+                return None
+            if not chunk.parts:
+                continue
             
-            # Final deduplication and cleaning
-            unique_product_urls = list(set(all_product_urls))
-            unique_product_urls.sort()
+            parts.append(chunk.text)
+            # The answer must open with the schema's JSON object; anything else
+            # won't parse, so stop generating now
+            if not opened:
+                head = ''.join(parts).lstrip()
+                if head and head[0] != '{':
+                    print(f"⚠️ Chunk {chunk_num}: Response isn't JSON ({head[:50]!r}...), skipping this chunk...")
+                    return None
+                opened = bool(head)
+        
+        response_text = ''.join(parts).strip()
+        if not response_text:
+            print(f"⚠️ Chunk {chunk_num}: Empty response, skipping this chunk...")
+            return None
+        return response_text
+
+    async def classify_url_chunk(self, model, chunk_urls: List[str], chunk_num: int, total_chunks: int,
+                                 on_product_urls: Callable[[List[str]], None] = None) -> Optional[List[str]]:
+        """Ask Gemini which URLs in one chunk are product pages (None if the chunk failed)."""
+        print(f"📦 Processing chunk {chunk_num}/{total_chunks} ({len(chunk_urls)} URLs)...")
+        
+        # Enhanced prompt with safer URL handling to avoid safety filters
+        # Instead of sending raw URLs, we'll sanitize them better
+        url_descriptions = []
+        for j, url in enumerate(chunk_urls, 1):
+            # More aggressive sanitization to avoid safety filters: drop query
+            # parameters, fragments and Amazon /ref= tracking paths. partition()
+            # keeps only the head and doesn't build a list per separator
+            clean_url = url.partition('?')[0].partition('#')[0].partition('/ref=')[0]
+            url_descriptions.append(f"{j}. {clean_url}")
+        
+        urls_text = "\n".join(url_descriptions)
+        
+        prompt = self.chunk_prompt.format(url_count=len(chunk_urls), urls_text=urls_text)
+
+        print(f"🤖 Sending chunk {chunk_num} ({len(chunk_urls)} URLs) to Gemini...")
+        if os.getenv('EXTRACT_DEBUG'):
+            print(f"🐛 DEBUG: Chunk prompt length: {len(prompt)} characters")
+        
+        try:
+            # Step 6: Call Gemini API to filter product URLs for this chunk
+            # Paced by the shared Gemini rate limiter (retries 429/5xx itself, mid-stream too)
+            # Streamed, so a blocked or non-JSON answer is dropped at its first
+            # chunk instead of after the whole generation
+            response_text = await generate_content_async(
+                model,
+                prompt,
+                stream=True,
+                read=lambda response: self.read_response_stream(response, chunk_num),
+                generation_config=genai.types.GenerationConfig(
+                    temperature=0.1,
+                    max_output_tokens=8192,
+                    response_mime_type="application/json",
+                    response_schema=URL_NUMBERS_SCHEMA
+                )
+            )
+            if response_text is None:
+                return None
+            if os.getenv('EXTRACT_DEBUG'):
+                print(f"🐛 DEBUG: Gemini chunk {chunk_num} response length: {len(response_text)} characters")
             
-            print(f"🧹 After deduplication: {len(unique_product_urls)} unique product URLs")
-            return unique_product_urls
+            # Step 7: Parse JSON response for this chunk
+            try:
+                # response_schema guarantees {"product_url_numbers": [...]}
+                url_numbers = loads(response_text)['product_url_numbers']
+                
+                # Get the URLs based on the returned numbers
+                chunk_product_urls = []
+                for num in url_numbers:
+                    if 1 <= num <= len(chunk_urls):
+                        chunk_product_urls.append(chunk_urls[num - 1])  # Convert to 0-based index
+                
+                print(f"✅ Chunk {chunk_num}: Found {len(chunk_product_urls)} product URLs")
+                self.store_verdicts(chunk_urls, chunk_product_urls)
+                if on_product_urls:
+                    on_product_urls(chunk_product_urls)
+                return chunk_product_urls
+                    
+            except (ValueError, KeyError, TypeError) as e:  # JSON decode error (json or orjson) or wrong shape
+                print(f"❌ Chunk {chunk_num} JSON parsing error: {str(e)}")
+                print(f"Response preview: {response_text[:200]}...")
                 
         except Exception as e:
-            print(f"❌ API error: {str(e)}")
-            return []
+            print(f"❌ Chunk {chunk_num} API error: {str(e)}")
+        
+        return None
 
-    def extract_product_urls_from_markdown(self, markdown_file: str, output_file: str):
-        """Main function to extract product URLs from markdown file."""
+    def extract_product_urls_from_markdown(self, markdown_file: str, output_file: str,
+                                           content: Union[str, mmap.mmap] = None, persist: bool = True,
+                                           on_product_urls: Callable[[List[str]], None] = None) -> Dict[str, Any]:
+        """Main function to extract product URLs from markdown file (or already-loaded content)."""
         print("🚀 Starting Markdown Product URL Extraction...")
         print(f"📄 Input: {markdown_file}")
         print(f"💾 Output: {output_file}")
         
-        # Load markdown content
-        content = self.load_markdown_file(markdown_file)
+        # Load markdown content unless it was handed over in memory
+        if content is None:
+            content = self.load_markdown_file(markdown_file)
         if not content:
             print("❌ No content to process")
-            return
+            return {}
         
         print(f"🔄 Processing entire file with Gemini AI + website analysis (chunked)")
-        print(f"📊 Content size: {len(content):,} characters")
+        print(f"📊 Content size: {describe_size(content)}")
         
         # Extract URLs from entire content
         try:
-            all_product_urls = self.extract_urls_from_content(content)
+            all_product_urls = self.extract_urls_from_content(content, on_product_urls)
             
             if all_product_urls:
-                # Remove duplicates and clean URLs
-                unique_urls = list(set(all_product_urls))
-                unique_urls.sort()
+                # extract_urls_from_content already returns them unique and sorted
+                unique_urls = all_product_urls
                 
                 # Determine site name from markdown file name
                 site_name = os.path.splitext(os.path.basename(markdown_file))[0]
@@ -333,16 +504,18 @@ Output as JSON: {{"product_url_numbers": [1, 5, 8, ...]}}"""
                 
                 # Save as JSON
                 try:
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        json.dump(output_data, f, ensure_ascii=False, indent=2)
+                    if persist:
+                        # JSONL: metadata header line, then one URL per line
+                        write_jsonl(output_file, {"extraction_metadata": output_data["extraction_metadata"]},
+                                    unique_urls)
                     
                     print(f"✅ Successfully extracted {len(unique_urls)} product URLs")
                     print(f"📊 Processing Summary:")
                     print(f"   - Source file: {markdown_file}")
-                    print(f"   - Content length: {len(content):,} characters")
+                    print(f"   - Content length: {describe_size(content)}")
                     print(f"   - Product URLs found: {len(unique_urls)}")
-                    print(f"   - Duplicates removed: {len(all_product_urls) - len(unique_urls)}")
-                    print(f"   - Saved to: {output_file}")
+                    if persist:
+                        print(f"   - Saved to: {output_file}")
                     
                     # Show sample URLs
                     if unique_urls:
@@ -354,12 +527,15 @@ Output as JSON: {{"product_url_numbers": [1, 5, 8, ...]}}"""
                     
                 except Exception as e:
                     print(f"❌ Error saving results: {str(e)}")
+                
+                return output_data
             else:
                 print("❌ No product URLs were extracted")
+                return {}
                 
         except Exception as e:
             print(f"❌ Failed to process file: {str(e)}")
-            return
+            return {}
 
 def main():
     """Main function to run the markdown product URL extraction with Gemini AI."""
@@ -371,7 +547,7 @@ def main():
     
     # Default files - can be customized
     markdown_file = "rakuten.md"
-    output_file = "rakuten_product_urls_from_markdown.json"
+    output_file = "rakuten_product_urls_from_markdown.jsonl"
     
     # Check if input file exists
     if not os.path.exists(markdown_file):
@@ -389,5 +565,18 @@ def main():
     
     print("\n✅ Extraction completed!")
 
+def run(input_obj=None, persist: bool = True) -> Dict[str, Any]:
+    """Pipeline entrypoint: extract product URLs from markdown text (or rakuten.md).
+    
+    Returns the same structure that is written to rakuten_product_urls_from_markdown.jsonl.
+    """
+    extractor = MarkdownProductURLExtractor()
+    return extractor.extract_product_urls_from_markdown(
+        "rakuten.md",
+        "rakuten_product_urls_from_markdown.jsonl",
+        content=input_obj,
+        persist=persist
+    )
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,80 @@
+"""
+Persistent result cache for the pipeline's Gemini calls
+Results are stored in a small SQLite database keyed by a hash of everything
+that determines the answer (model, prompt, content), so re-runs and retries
+after partial failures skip API calls for content that was already processed.
+
+Controlled by the GEMINI_CACHE environment variable:
+  on (default) - read and write the cache
+  refresh      - ignore cached entries but store fresh results
+  off          - don't touch the cache at all
+Other caches (e.g. the scraper's page cache) pass their own mode instead.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable, Optional, Tuple
+
+from pipeline_io import loads
+
+CACHE_DIR = ".cache"
+
+class ResultCache:
+    def __init__(self, name: str, cache_dir: str = CACHE_DIR, mode: str = None):
+        """Open (or create) the cache database .cache/<name>.sqlite."""
+        self.mode = (mode or os.getenv('GEMINI_CACHE', 'on')).lower()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if self.mode == 'off':
+            return
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # Steps may run on worker threads; all access goes through the lock
+        self._conn = sqlite3.connect(os.path.join(cache_dir, f"{name}.sqlite"), check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Hash the parts that determine a result into a cache key."""
+        digest = hashlib.blake2b(digest_size=32)
+        for part in parts:
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached result for key, or None."""
+        if self._conn is None or self.mode == 'refresh':
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a result under key."""
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)",
+                               (key, json.dumps(value, ensure_ascii=False)))
+            self._conn.commit()
+
+    def set_many(self, items: Iterable[Tuple[str, Any]]) -> None:
+        """Store several (key, result) pairs in one transaction."""
+        if self._conn is None:
+            return
+        rows = [(key, json.dumps(value, ensure_ascii=False)) for key, value in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", rows)
+            self._conn.commit()
@@ -0,0 +1,208 @@
+"""
+Shared HTTP/API client setup for the pipeline scripts
+When the pipeline runs its steps in-process, every step shares one Gemini API
+client (and therefore its open TCP/TLS connections) instead of reconnecting.
+All Gemini calls in a process also share one rate limiter, so concurrent steps
+and threads stay inside GEMINI_RPM requests per minute together (and, when
+GEMINI_TPM is set, that many input tokens per minute too). The limiter is per
+process: when several pipeline processes run at once, the orchestrator hands
+each one its share of the quota through these variables.
+"""
+
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+import google.generativeai as genai
+
+_configure_lock = threading.Lock()
+_configured_api_key = None
+
+# HTTP statuses worth retrying: rate limited or a transient server-side failure
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Gemini puts the server's suggested wait in the 429 message ("Please retry in 38.2s"
+# and/or a RetryInfo "retry_delay { seconds: 38 }" detail)
+RETRY_AFTER_PATTERN = re.compile(r'retry in ([\d.]+)\s*s|retry_delay\s*\{\s*seconds:\s*(\d+)', re.IGNORECASE)
+# A response wrapped in a Markdown code fence (```json ... ```, any case/whitespace)
+CODE_FENCE_PATTERN = re.compile(r'^\s*```(?:json)?\s*(.*?)\s*```\s*$', re.DOTALL | re.IGNORECASE)
+
+def configure_gemini(api_key: str) -> None:
+    """Configure google-generativeai once per process.
+
+    genai.configure() throws away the SDK's cached API clients, so calling it
+    from every step (or every extractor instance) would reconnect each time.
+    Re-configuring only happens when the API key actually changes.
+    """
+    global _configured_api_key
+    with _configure_lock:
+        if api_key == _configured_api_key:
+            return
+        genai.configure(api_key=api_key)
+        _configured_api_key = api_key
+
+class TokenBucket:
+    """Thread-safe token bucket: rate_per_min units per minute, bursts up to burst.
+    
+    A unit is one request by default; callers can charge a larger cost (e.g.
+    prompt tokens). Costs above burst are charged as burst, so they still pass.
+    """
+
+    def __init__(self, rate_per_min: float, burst: int = 1):
+        self.rate = rate_per_min / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _take(self, cost: float = 1) -> float:
+        """Take cost tokens if available (returns 0), else return how long to wait."""
+        cost = min(cost, self.burst)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now >= self.blocked_until and self.tokens >= cost:
+                self.tokens -= cost
+                return 0.0
+            return max(self.blocked_until - now, (cost - self.tokens) / self.rate)
+
+    def acquire(self, cost: float = 1) -> None:
+        """Block until a request (costing cost tokens) may be sent."""
+        while (wait := self._take(cost)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, cost: float = 1) -> None:
+        """Wait (without blocking the event loop) until a request may be sent."""
+        while (wait := self._take(cost)) > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for seconds (the server said we're over quota)."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+def gemini_limiter() -> TokenBucket:
+    """This process's Gemini rate limiter (GEMINI_RPM requests per minute, default 15)."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            rate = float(os.getenv('GEMINI_RPM', '15'))
+            _limiter = TokenBucket(rate, burst=max(1, int(rate // 5)))
+        return _limiter
+
+_token_limiter = None
+
+def gemini_token_limiter() -> Optional[TokenBucket]:
+    """This process's input-token limiter (GEMINI_TPM tokens per minute), or None if unset."""
+    global _token_limiter
+    rate = float(os.getenv('GEMINI_TPM', '0'))
+    if rate <= 0:
+        return None
+    with _limiter_lock:
+        if _token_limiter is None:
+            _token_limiter = TokenBucket(rate, burst=int(rate))
+        return _token_limiter
+
+def estimate_tokens(contents) -> int:
+    """Rough prompt size in tokens (~4 characters each) for text prompts, else 0."""
+    if isinstance(contents, str):
+        return len(contents) // 4
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(part) for part in contents)
+    return 0
+
+def strip_code_fence(text: str) -> str:
+    """Return the payload of a fenced response, or the text itself if it isn't fenced."""
+    match = CODE_FENCE_PATTERN.match(text)
+    return match.group(1) if match else text
+
+def parse_retry_after(error: Exception) -> float:
+    """Seconds the server asked us to wait, or None."""
+    match = RETRY_AFTER_PATTERN.search(str(error))
+    if not match:
+        return None
+    return float(match.group(1) or match.group(2))
+
+def retry_delay(error: Exception, attempt: int, max_retries: int, limiter: TokenBucket) -> float:
+    """Seconds to wait before retrying after error; re-raises it if it isn't retryable.
+
+    429 and 5xx responses are retried with exponential backoff plus jitter,
+    waiting at least as long as the server's retry hint; a 429 also pauses
+    every other caller sharing the limiter.
+    """
+    status = getattr(error, 'code', None)
+    if status not in RETRYABLE_STATUS or attempt == max_retries:
+        raise error
+    
+    delay = min(30, 2 ** attempt) + random.uniform(0, 1)
+    retry_after = parse_retry_after(error)
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, 1))
+    if status == 429:
+        limiter.pause(delay)
+    print(f"⏳ Gemini returned {status}, retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+    return delay
+
+def generate_content(model, *args, max_retries: int = 5, **kwargs):
+    """model.generate_content() behind the shared rate limiter, with retries (see retry_delay)."""
+    limiter = gemini_limiter()
+    token_limiter = gemini_token_limiter()
+    prompt_tokens = estimate_tokens(args[0] if args else kwargs.get('contents'))
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        if token_limiter:
+            token_limiter.acquire(prompt_tokens)
+        try:
+            return model.generate_content(*args, **kwargs)
+        except Exception as e:
+            time.sleep(retry_delay(e, attempt, max_retries, limiter))
+
+_async_model_loop = None
+
+def async_gemini_model(*args, **kwargs) -> genai.GenerativeModel:
+    """genai.GenerativeModel(*args, **kwargs) for async calls on the running event loop.
+
+    The SDK's async (grpc.aio) client is tied to the event loop it was created
+    on, and both the SDK and every model cache it. Build the model inside each
+    new loop (each asyncio.run() in the pipeline): the first model on a new loop
+    re-runs genai.configure(), which drops the SDK's cached clients, so the model
+    opens a fresh channel on this loop; later models on the same loop share it.
+    """
+    global _async_model_loop
+    loop = asyncio.get_running_loop()
+    with _configure_lock:
+        if loop is not _async_model_loop:
+            genai.configure(api_key=_configured_api_key)
+            _async_model_loop = loop
+    return genai.GenerativeModel(*args, **kwargs)
+
+async def generate_content_async(model, *args, max_retries: int = 5,
+                                 read: Callable[[object], Awaitable] = None, **kwargs):
+    """model.generate_content_async() behind the shared rate limiter, with retries.
+
+    With stream=True, pass read to consume the stream: it gets the response and
+    its result is returned. An error raised mid-stream (e.g. a 429 after the
+    first chunk) then goes through the same retries as one raised up front.
+
+    model must come from async_gemini_model() on the running loop.
+    """
+    limiter = gemini_limiter()
+    token_limiter = gemini_token_limiter()
+    prompt_tokens = estimate_tokens(args[0] if args else kwargs.get('contents'))
+    for attempt in range(max_retries + 1):
+        await limiter.acquire_async()
+        if token_limiter:
+            await token_limiter.acquire_async(prompt_tokens)
+        try:
+            response = await model.generate_content_async(*args, **kwargs)
+            return await read(response) if read else response
+        except Exception as e:
+            await asyncio.sleep(retry_delay(e, attempt, max_retries, limiter))
@@ -0,0 +1,119 @@
+"""
+JSONL helpers for the pipeline's intermediate files
+Each file starts with one header line (the metadata object, e.g.
+{"extraction_metadata": {...}}) followed by one item per line, so readers can
+stream items without loading the whole file and a crash only loses the last line.
+Files are written to a temporary name and renamed into place, so a reader never
+sees a half-written file.
+"""
+
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+try:
+    import orjson
+
+    def dumps_line(obj: Any) -> bytes:
+        return orjson.dumps(obj) + b"\n"
+
+    def dumps_pretty(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+except ImportError:  # Optional: fall back to the stdlib encoder
+    import json
+
+    def dumps_line(obj: Any) -> bytes:
+        return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+    def dumps_pretty(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+    loads = json.loads
+
+@contextmanager
+def atomic_open(path: str, mode: str = 'wb', **kwargs):
+    """Open path.tmp for writing, then fsync it and rename it over path on success."""
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def drop_page_cache(path: str) -> None:
+    """Tell the kernel a consumed intermediate file's cached pages can go (Linux only)."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+def write_json(path: str, obj: Any) -> None:
+    """Write obj as an indented JSON document (for files people read)."""
+    with atomic_open(path) as f:
+        f.write(dumps_pretty(obj))
+
+def write_jsonl(path: str, header: Dict[str, Any], items: Iterable[Any]) -> int:
+    """Write a header line plus one line per item; returns the number of items."""
+    count = 0
+    with atomic_open(path) as f:
+        f.write(dumps_line(header))
+        for item in items:
+            f.write(dumps_line(item))
+            count += 1
+    return count
+
+@contextmanager
+def spool_jsonl(path: str, make_header: Callable[[], Dict[str, Any]]):
+    """Yield an append(item) function that spools items to disk as they arrive.
+    
+    On success the header from make_header() (called after the last item, so it
+    can carry running totals) and the spooled items are written to path.
+    """
+    spool_path = path + '.items'
+    try:
+        with open(spool_path, 'wb') as spool:
+            yield lambda item: spool.write(dumps_line(item))
+        with atomic_open(path) as f, open(spool_path, 'rb') as spool:
+            f.write(dumps_line(make_header()))
+            shutil.copyfileobj(spool, f, 1 << 20)
+    finally:
+        try:
+            os.remove(spool_path)
+        except OSError:
+            pass
+
+def iter_jsonl(path: str) -> Iterator[Any]:
+    """Yield every decoded line (header first), skipping a truncated last line."""
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield loads(line)
+            except ValueError:
+                if not line.endswith(b"\n"):
+                    return  # partial write from an interrupted run
+                raise
+
+def load_jsonl(path: str, items_key: str) -> Dict[str, Any]:
+    """Load a JSONL file back into the {header..., items_key: [items]} structure."""
+    lines = iter_jsonl(path)
+    data = dict(next(lines, None) or {})
+    data[items_key] = list(lines)
+    return data
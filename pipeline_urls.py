@@ -0,0 +1,98 @@
+"""
+URL canonicalization for the pipeline
+The URL extractor often returns the same product several times (once per search
+page, with different tracking parameters). Canonicalizing before scraping means
+each product page is fetched once.
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {
+    'scid', 'sc2id', 'icm_acid', 'icm_cid', 'icm_agid', 'iasid', 'rafcid', 'l-id', 's-id',
+    'gclid', 'fbclid', 'yclid', 'msclkid', '_ga', 'ref', 'ref_', 'tag', 'psc', 'th',
+}
+TRACKING_PREFIXES = ('utm_', 'pd_rd_', 'pf_rd_', 'icm_')
+
+# URLs that can't be product pages: static assets, and site chrome such as
+# search, category, account, cart and help pages
+STATIC_ASSET_PATTERN = re.compile(
+    r'\.(?:jpe?g|png|gif|webp|avif|svg|css|js|ico|woff2?|ttf|otf|mp4|mp3|pdf)(?:[?#]|$)', re.IGNORECASE)
+NON_PRODUCT_PATH_PATTERN = re.compile(
+    r'/(?:search|category|categories|account|login|register|signup|cart|checkout|help|faq|about)(?:[/?#]|$)',
+    re.IGNORECASE)
+# Image/CDN hosts: everything they serve is an asset, with or without a file extension
+ASSET_HOSTS = frozenset({
+    'm.media-amazon.com', 'images-na.ssl-images-amazon.com', 'images-fe.ssl-images-amazon.com',
+    'thumbnail.image.rakuten.co.jp', 'image.rakuten.co.jp', 'r.r10s.jp', 'tshop.r10s.jp',
+    'item-shopping.c.yimg.jp', 's.yimg.jp',
+})
+# Host -> path pattern of that site's product pages (known for certain, no need to ask Gemini)
+AMAZON_PRODUCT_PATH = re.compile(r'/(?:dp|gp/product|gp/aw/d)/[A-Z0-9]{10}(?:/|$)')
+KNOWN_PRODUCT_PATHS = {
+    'item.rakuten.co.jp': re.compile(r'^/[^/]+/[^/]+/?$'),  # /{shop}/{item}/
+    'www.amazon.co.jp': AMAZON_PRODUCT_PATH,
+    'amazon.co.jp': AMAZON_PRODUCT_PATH,
+    'store.shopping.yahoo.co.jp': re.compile(r'^/[^/]+/[^/]+\.html$'),  # /{store}/{item}.html
+    'wowma.jp': re.compile(r'^/item/\d+'),
+}
+# A path segment carrying an ID (any digit), e.g. B0FF398NMR or item-1234
+ID_SEGMENT_PATTERN = re.compile(r'[^/]*\d[^/]*')
+
+def is_tracking_param(pair: str) -> bool:
+    """True for a raw 'key=value' query pair whose key only tracks where a click came from."""
+    key = unquote_plus(pair.partition('=')[0]).lower()
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+def canonical_url(url: str) -> str:
+    """Lowercase scheme/host, collapse leading '//' in the path, drop tracking params and the fragment.
+    
+    Only the start of the path is collapsed, so a URL embedded in a redirect
+    path (/https://...) stays intact. The remaining query pairs keep their
+    order and original text - nothing is decoded and re-encoded - since some
+    redirect links are signed.
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path
+    if path.startswith('//'):
+        path = '/' + path.lstrip('/')
+    query = '&'.join(pair for pair in parts.query.split('&') if not is_tracking_param(pair))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ''))
+
+def dedupe_urls(urls: Iterable[str]) -> List[str]:
+    """Canonicalize urls and drop repeats, keeping first-seen order."""
+    return list(dict.fromkeys(canonical_url(url) for url in urls))
+
+@lru_cache(maxsize=65536)
+def host_and_path(url: str) -> Tuple[str, str]:
+    """(lowercased host, path) of url.
+    
+    The extractor runs each URL through several host/path checks in separate
+    passes; urlsplit's own cache only holds 128 entries, so they'd re-parse it.
+    """
+    parts = urlsplit(url)
+    return parts.netloc.lower(), parts.path
+
+def is_candidate_product_url(url: str) -> bool:
+    """Cheap pre-filter: False for URLs that are obviously not product pages."""
+    if STATIC_ASSET_PATTERN.search(url) or NON_PRODUCT_PATH_PATTERN.search(url):
+        return False
+    return host_and_path(url)[0] not in ASSET_HOSTS
+
+def url_template(url: str) -> str:
+    """Host plus path with ID-bearing segments replaced by {id} (query, fragment and /ref= dropped).
+    
+    URLs sharing a template are the same kind of page, e.g. every
+    www.amazon.co.jp/dp/{id} is a product page.
+    """
+    host, path = host_and_path(url)
+    return host + ID_SEGMENT_PATTERN.sub('{id}', path.partition('/ref=')[0])
+
+def is_known_product_url(url: str) -> bool:
+    """True for URLs whose host and path are a known product-page scheme (see KNOWN_PRODUCT_PATHS)."""
+    host, path = host_and_path(url)
+    pattern = KNOWN_PRODUCT_PATHS.get(host)
+    return bool(pattern and pattern.search(path))
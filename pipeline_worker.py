@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Warm worker processes for the pipeline's subprocess mode
+Starting a fresh interpreter per step pays for importing crawl4ai, playwright and
+google-generativeai every time. A warm worker imports the step scripts once and
+then runs steps on request, so only the first step in each worker pays the
+import cost.
+
+Protocol: the orchestrator writes one JSON job per line to the worker's stdin
+({"module": ..., "cwd": ..., "env": {...}}). The worker runs module.run() and
+prints its output as usual, followed by a line containing RESULT_MARKER and a
+JSON result ({"ok": bool, "error": str}).
+"""
+
+import asyncio
+import gc
+import importlib
+import inspect
+import json
+import os
+import sys
+import traceback
+from typing import Callable, Dict, List
+
+RESULT_MARKER = "\x00pipeline-worker-result "
+
+# Step scripts preloaded by every worker
+STEP_MODULES = [
+    'ecommerce_stealth_crawler_fixed',
+    'markdown_product_url_extractor',
+    'rakuten_bulk_product_scraper',
+    'rakuten_gemini_processor',
+    'rakuten_csv_converter',
+]
+
+def run_job(job: Dict) -> Dict:
+    """Run one step in this process with the job's working directory and environment."""
+    home = os.getcwd()
+    environ = dict(os.environ)
+    try:
+        os.environ.clear()
+        os.environ.update(job.get('env') or {})
+        if job.get('cwd'):
+            os.chdir(job['cwd'])
+        module = importlib.import_module(job['module'])
+        # Only success is reported back, so steps needn't build their return value
+        kwargs = {'keep_results': False} if 'keep_results' in inspect.signature(module.run).parameters else {}
+        result = module.run(None, persist=True, **kwargs)
+        return {"ok": bool(result)}
+    except SystemExit as e:
+        return {"ok": e.code in (0, None)}
+    except BaseException as e:
+        traceback.print_exc(file=sys.stdout)
+        return {"ok": False, "error": str(e)}
+    finally:
+        os.chdir(home)
+        os.environ.clear()
+        os.environ.update(environ)
+        gc.collect()
+
+def worker_main():
+    """Serve jobs from stdin until it is closed."""
+    # Pay the import cost up front; a module that fails to import here is
+    # retried (and reported) when a job actually needs it
+    for name in STEP_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        result = run_job(json.loads(line))
+        sys.stderr.flush()
+        sys.stdout.write(f"\n{RESULT_MARKER}{json.dumps(result)}\n")
+        sys.stdout.flush()
+
+class WarmWorkerPool:
+    """A few long-lived worker processes shared by every pipeline in this process."""
+
+    def __init__(self, size: int = 2, python: str = None):
+        self.size = size
+        self.python = python or os.path.abspath(sys.executable)
+        self.script = os.path.abspath(__file__)
+        self._idle = None
+        self._procs: List[asyncio.subprocess.Process] = []
+
+    async def _launch(self) -> asyncio.subprocess.Process:
+        proc = await asyncio.create_subprocess_exec(
+            self.python, self.script,
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT, close_fds=False, limit=1 << 20,
+            cwd=os.path.dirname(self.script)
+        )
+        self._procs.append(proc)
+        return proc
+
+    async def _replace(self, proc: asyncio.subprocess.Process) -> asyncio.subprocess.Process:
+        """Reap a dead worker and launch a fresh one in its place."""
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+        self._procs.remove(proc)
+        return await self._launch()
+
+    async def start(self):
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for proc in await asyncio.gather(*(self._launch() for _ in range(self.size))):
+            self._idle.put_nowait(proc)
+
+    async def submit(self, module: str, cwd: str, env: Dict[str, str],
+                     on_output: Callable[[bytes], None]) -> bool:
+        """Run module.run() in an idle worker, passing its output to on_output; returns success."""
+        await self.start()
+        proc = await self._idle.get()
+        clean = False
+        try:
+            job = {"module": module, "cwd": os.path.abspath(cwd or os.getcwd()),
+                   "env": dict(os.environ if env is None else env)}
+            try:
+                proc.stdin.write((json.dumps(job) + "\n").encode('utf-8'))
+                await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                return False  # the worker died while idle
+
+            marker = RESULT_MARKER.encode('utf-8')
+            while line := await proc.stdout.readline():
+                if marker in line:
+                    before, _, result = line.partition(marker)
+                    if before.strip():
+                        on_output(before)
+                    ok = json.loads(result).get("ok", False)
+                    clean = True
+                    return ok
+                on_output(line)
+
+            return False  # EOF: the worker died mid-job
+        finally:
+            if clean:
+                self._idle.put_nowait(proc)
+            else:
+                # Dead, cancelled mid-job or with unread output: the worker can't
+                # take another job, so kill it and requeue a fresh one
+                self._idle.put_nowait(await self._replace(proc))
+
+    async def close(self):
+        for proc in self._procs:
+            if proc.returncode is None:
+                proc.stdin.close()
+        await asyncio.gather(*(proc.wait() for proc in self._procs))
+        self._procs.clear()
+        self._idle = None
+
+if __name__ == "__main__":
+    worker_main()
@@ -1,16 +1,113 @@
 #!/usr/bin/env python3
 """
 Bulk Rakuten Product Scraper
-Reads URLs from rakuten_product_urls_from_markdown.json, validates them, and scrapes product data
+Reads URLs from rakuten_product_urls_from_markdown.jsonl, validates them, and scrapes product data
 """
 
 import asyncio
-import json
 import re
 import os
-from typing import List, Dict, Set
+from typing import Callable, List, Dict, Set
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig, CacheMode, BrowserConfig
 from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+from pipeline_cache import ResultCache
+from pipeline_io import load_jsonl, spool_jsonl, write_jsonl
+from pipeline_urls import dedupe_urls
+
+# Pages scraped by earlier runs, keyed by canonical URL. Off unless SCRAPE_CACHE
+# is set (on/refresh), since product pages (prices, stock) change over time.
+page_cache = ResultCache('scraped_pages', mode=os.getenv('SCRAPE_CACHE', 'off'))
+
+# Shop and item ID of a Rakuten product URL
+RAKUTEN_ITEM_PATTERN = re.compile(r'item\.rakuten\.co\.jp/([^/]+)/([^/?]+)')
+# Item IDs that look like real products: long numeric codes, or alphanumeric
+# codes that aren't generic words
+NUMERIC_ITEM_ID_PATTERN = re.compile(r'\d{8,}')
+ALPHANUMERIC_ITEM_ID_PATTERN = re.compile(r'[a-zA-Z0-9\-_]{5,}$')
+GENERIC_ITEM_ID_PATTERN = re.compile(r'(?:item|product|aa|zakka)\d*$', re.IGNORECASE)
+
+def create_run_config() -> CrawlerRunConfig:
+    """
+    Per-page crawl configuration like page.py (built once, shared by every page)
+    
+    Returns:
+        CrawlerRunConfig: Config passed to every crawler.arun() call
+    """
+    
+    # Configure the markdown generator EXACTLY like page.py - remove links only
+    md_generator = DefaultMarkdownGenerator(
+        content_source="raw_html",           # Use raw HTML - preserves ALL content!
+        options={
+            "ignore_links": True,           # ONLY remove links - this is our goal
+            "ignore_images": False,         # Keep product images 
+            "escape_html": True,           # Clean HTML entities
+            "body_width": 0,               # No line wrapping
+            "skip_internal_links": True,   # Skip anchors
+            "include_sup_sub": True,       # Handle superscript/subscript
+            "mark_code": True,             # Preserve code formatting
+            "unicode_snob": True,          # Better Unicode handling
+            "decode_errors": "ignore"      # Ignore encoding errors
+        }
+    )
+    
+    # Configure crawler with ADVANCED Crawl4AI features like page.py (optimized for Gemini processing)
+    return CrawlerRunConfig(
+        markdown_generator=md_generator,
+        
+        # CONTENT PROCESSING (Optimized for Gemini)
+        word_count_threshold=0,              # No word filtering - let Gemini decide
+        only_text=False,                     # Keep structured HTML for Gemini context
+        keep_data_attributes=True,           # Preserve product data attributes
+        remove_forms=True,                   # Remove search/login forms
+        excluded_tags=['script', 'style', 'noscript'],  # Minimal filtering
+        
+        # ENHANCED MEDIA HANDLING for Product Images
+        wait_for_images=True,                # Wait for product images to load
+        image_score_threshold=3,             # Filter low-quality images
+        image_description_min_word_threshold=5,  # Better alt text filtering
+        exclude_external_images=False,      # Keep all product images (even CDN)
+        
+        # LAZY LOADING & SCROLLING OPTIMIZATION
+        scan_full_page=True,                 # Scroll entire page for lazy content
+        scroll_delay=0.5,                    # Delay between scroll steps
+        
+        # SMART WAITING (instead of fixed delays)
+        wait_for="js:() => document.querySelector('[data-asin], .product, #productTitle, .product-title, [class*=\"price\"], [id*=\"price\"]') !== null || document.querySelectorAll('img').length > 5",
+        
+        # ANTI-DETECTION (Enhanced)
+        simulate_user=True,                  # Human-like interactions  
+        override_navigator=True,             # Handle navigator detection
+        magic=True,                          # Smart content detection
+        remove_overlay_elements=True,        # Remove popups that block content
+        
+        # CACHE & PERFORMANCE
+        cache_mode=CacheMode.BYPASS,         # Always get fresh product data
+        page_timeout=60000,                  # 60 second timeout
+        delay_before_return_html=8.0,        # Final wait before capture
+        
+        # ADVANCED JAVASCRIPT HANDLING (Using documentation best practices)
+        js_code=[
+            # Step 1: Initial page load wait
+            "await new Promise(resolve => setTimeout(resolve, 2000));",
+            
+            # Step 2: Progressive scrolling to trigger lazy loading  
+            "window.scrollTo(0, document.body.scrollHeight/4);",
+            "await new Promise(resolve => setTimeout(resolve, 1500));",
+            
+            # Step 3: More scrolling for complete content
+            "window.scrollTo(0, document.body.scrollHeight/2);", 
+            "await new Promise(resolve => setTimeout(resolve, 1500));",
+            "window.scrollTo(0, document.body.scrollHeight * 0.75);",
+            "await new Promise(resolve => setTimeout(resolve, 1500));",
+            
+            # Step 4: Final scroll and wait
+            "window.scrollTo(0, document.body.scrollHeight);",
+            "await new Promise(resolve => setTimeout(resolve, 2000));",
+        ]
+    )
+
+# Same settings for every product page, so the config is built once
+run_config = create_run_config()
 
 def validate_product_url(url: str) -> bool:
     """
@@ -23,21 +120,11 @@ def validate_product_url(url: str) -> bool:
         bool: True if valid product URL, False otherwise
     """
     
-    # Basic validation patterns
-    invalid_patterns = [
-        
-    ]
-    
-    # Check against invalid patterns
-    for pattern in invalid_patterns:
-        if re.search(pattern, url, re.IGNORECASE):
-            return False
-    
     # Valid product URLs should have meaningful product IDs
     # Extract the product ID part
-    match = re.search(r'item\.rakuten\.co\.jp/[^/]+/([^/?]+)', url)
+    match = RAKUTEN_ITEM_PATTERN.search(url)
     if match:
-        product_id = match.group(1)
+        product_id = match.group(2)
         
         # Valid product IDs are usually:
         # - Long numeric codes (8+ digits)
@@ -46,20 +133,21 @@ def validate_product_url(url: str) -> bool:
         
         if len(product_id) >= 5:
             # Check if it's mostly numeric (good sign)
-            if re.match(r'^\d{8,}', product_id):
+            if NUMERIC_ITEM_ID_PATTERN.match(product_id):
                 return True
             # Check if it's alphanumeric with good length
-            if re.match(r'^[a-zA-Z0-9\-_]{5,}$', product_id) and not re.match(r'^(item|product|aa|zakka)\d*$', product_id, re.IGNORECASE):
+            if (ALPHANUMERIC_ITEM_ID_PATTERN.match(product_id)
+                    and not GENERIC_ITEM_ID_PATTERN.match(product_id)):
                 return True
     
     return False
 
-def load_urls_from_file(file_path: str = 'rakuten_product_urls_from_markdown.json') -> List[str]:
+def load_urls_from_file(file_path: str = 'rakuten_product_urls_from_markdown.jsonl') -> List[str]:
     """
-    Load URLs from JSON file and validate them
+    Load URLs from JSONL file and validate them
     
     Args:
-        file_path (str): Path to the URLs JSON file
+        file_path (str): Path to the URLs JSONL file
         
     Returns:
         List[str]: List of valid product URLs
@@ -70,43 +158,61 @@ def load_urls_from_file(file_path: str = 'rakuten_product_urls_from_markdown.jso
         return []
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Extract URLs from JSON structure
-        all_urls = data.get('product_urls', [])
-        
-        print(f"📖 Loaded {len(all_urls)} URLs from {file_path}")
-        print(f"🌐 Site: {data.get('extraction_metadata', {}).get('site_name', 'unknown')}")
-        print(f"🤖 Extraction Method: {data.get('extraction_metadata', {}).get('extraction_method', 'unknown')}")
-        
-        # Only filter out obvious review URLs, keep everything else
-        valid_urls = []
-        filtered_urls = []
+        data = load_jsonl(file_path, 'product_urls')
         
-        for url in all_urls:
-            # Only exclude review URLs since they're not product pages
-            if 'review.rakuten.co.jp' in url:
-                filtered_urls.append(url)
-            else:
-                valid_urls.append(url)
-        
-        print(f"✅ Product URLs to scrape: {len(valid_urls)}")
-        print(f"🚫 Filtered review URLs: {len(filtered_urls)}")
-        
-        if filtered_urls:
-            print(f"\n🚫 Sample filtered review URLs:")
-            for i, url in enumerate(filtered_urls[:3]):
-                print(f"   {i+1}. {url}")
-            if len(filtered_urls) > 3:
-                print(f"   ... and {len(filtered_urls) - 3} more")
-        
-        return valid_urls
+        return select_urls(data, file_path)
         
     except Exception as e:
         print(f"❌ Error reading URLs file: {e}")
         return []
 
+def is_scrapable_url(url: str) -> bool:
+    """Only review URLs are excluded - they're not product pages"""
+    return 'review.rakuten.co.jp' not in url
+
+def select_urls(data: Dict, source: str = 'memory') -> List[str]:
+    """
+    Pick the URLs to scrape from the URL extractor's output structure
+    
+    Args:
+        data (Dict): Parsed rakuten_product_urls_from_markdown.jsonl content
+        source (str): Where the data came from (for logging)
+        
+    Returns:
+        List[str]: List of valid product URLs
+    """
+    
+    # Extract URLs from JSON structure; the same product often appears with
+    # different tracking parameters, so canonicalize and drop repeats
+    loaded_urls = data.get('product_urls', [])
+    all_urls = dedupe_urls(loaded_urls)
+    
+    print(f"📖 Loaded {len(loaded_urls)} URLs from {source} ({len(loaded_urls) - len(all_urls)} duplicates dropped)")
+    print(f"🌐 Site: {data.get('extraction_metadata', {}).get('site_name', 'unknown')}")
+    print(f"🤖 Extraction Method: {data.get('extraction_metadata', {}).get('extraction_method', 'unknown')}")
+    
+    # Only filter out obvious review URLs, keep everything else
+    valid_urls = []
+    filtered_urls = []
+    
+    for url in all_urls:
+        if is_scrapable_url(url):
+            valid_urls.append(url)
+        else:
+            filtered_urls.append(url)
+    
+    print(f"✅ Product URLs to scrape: {len(valid_urls)}")
+    print(f"🚫 Filtered review URLs: {len(filtered_urls)}")
+    
+    if filtered_urls:
+        print(f"\n🚫 Sample filtered review URLs:")
+        for i, url in enumerate(filtered_urls[:3]):
+            print(f"   {i+1}. {url}")
+        if len(filtered_urls) > 3:
+            print(f"   ... and {len(filtered_urls) - 3} more")
+    
+    return valid_urls
+
 async def scrape_product_url(crawler, url: str, index: int, total: int) -> Dict:
     """
     Scrape a single product URL and return structured data with clean markdown (no links)
@@ -115,92 +221,26 @@ async def scrape_product_url(crawler, url: str, index: int, total: int) -> Dict:
         crawler: AsyncWebCrawler instance
         url (str): URL to scrape
         index (int): Current index
-        total (int): Total number of URLs
+        total (int): Total number of URLs (None when streaming and not yet known)
         
     Returns:
         Dict: Scraped product data
     """
     
-    print(f"🔗 [{index+1}/{total}] Scraping: {url}")
+    progress = f"{index+1}/{total}" if total else f"{index+1}"
     
     try:
-        # Configure the markdown generator EXACTLY like page.py - remove links only
-        md_generator = DefaultMarkdownGenerator(
-            content_source="raw_html",           # Use raw HTML - preserves ALL content!
-            options={
-                "ignore_links": True,           # ONLY remove links - this is our goal
-                "ignore_images": False,         # Keep product images 
-                "escape_html": True,           # Clean HTML entities
-                "body_width": 0,               # No line wrapping
-                "skip_internal_links": True,   # Skip anchors
-                "include_sup_sub": True,       # Handle superscript/subscript
-                "mark_code": True,             # Preserve code formatting
-                "unicode_snob": True,          # Better Unicode handling
-                "decode_errors": "ignore"      # Ignore encoding errors
-            }
-        )
-        
-        # Configure crawler with ADVANCED Crawl4AI features like page.py (optimized for Gemini processing)
-        config = CrawlerRunConfig(
-            markdown_generator=md_generator,
-            
-            # CONTENT PROCESSING (Optimized for Gemini)
-            word_count_threshold=0,              # No word filtering - let Gemini decide
-            only_text=False,                     # Keep structured HTML for Gemini context
-            keep_data_attributes=True,           # Preserve product data attributes
-            remove_forms=True,                   # Remove search/login forms
-            excluded_tags=['script', 'style', 'noscript'],  # Minimal filtering
-            
-            # ENHANCED MEDIA HANDLING for Product Images
-            wait_for_images=True,                # Wait for product images to load
-            image_score_threshold=3,             # Filter low-quality images
-            image_description_min_word_threshold=5,  # Better alt text filtering
-            exclude_external_images=False,      # Keep all product images (even CDN)
-            
-            # LAZY LOADING & SCROLLING OPTIMIZATION
-            scan_full_page=True,                 # Scroll entire page for lazy content
-            scroll_delay=0.5,                    # Delay between scroll steps
-            
-            # SMART WAITING (instead of fixed delays)
-            wait_for="js:() => document.querySelector('[data-asin], .product, #productTitle, .product-title, [class*=\"price\"], [id*=\"price\"]') !== null || document.querySelectorAll('img').length > 5",
-            
-            # ANTI-DETECTION (Enhanced)
-            simulate_user=True,                  # Human-like interactions  
-            override_navigator=True,             # Handle navigator detection
-            magic=True,                          # Smart content detection
-            remove_overlay_elements=True,        # Remove popups that block content
-            
-            # CACHE & PERFORMANCE
-            cache_mode=CacheMode.BYPASS,         # Always get fresh product data
-            page_timeout=60000,                  # 60 second timeout
-            delay_before_return_html=8.0,        # Final wait before capture
-            
-            # ADVANCED JAVASCRIPT HANDLING (Using documentation best practices)
-            js_code=[
-                # Step 1: Initial page load wait
-                "await new Promise(resolve => setTimeout(resolve, 2000));",
-                
-                # Step 2: Progressive scrolling to trigger lazy loading  
-                "window.scrollTo(0, document.body.scrollHeight/4);",
-                "await new Promise(resolve => setTimeout(resolve, 1500));",
-                
-                # Step 3: More scrolling for complete content
-                "window.scrollTo(0, document.body.scrollHeight/2);", 
-                "await new Promise(resolve => setTimeout(resolve, 1500));",
-                "window.scrollTo(0, document.body.scrollHeight * 0.75);",
-                "await new Promise(resolve => setTimeout(resolve, 1500));",
-                
-                # Step 4: Final scroll and wait
-                "window.scrollTo(0, document.body.scrollHeight);",
-                "await new Promise(resolve => setTimeout(resolve, 2000));",
-            ]
-        )
+        cached = page_cache.get(ResultCache.make_key(url))
+        if cached is not None:
+            print(f"♻️ [{progress}] Cached: {url}")
+            return cached
         
-        result = await crawler.arun(url, config=config)
+        print(f"🔗 [{progress}] Scraping: {url}")
+        result = await crawler.arun(url, config=run_config)
         
         if result.success:
             # Extract basic product info from URL
-            url_match = re.search(r'item\.rakuten\.co\.jp/([^/]+)/([^/?]+)', url)
+            url_match = RAKUTEN_ITEM_PATTERN.search(url)
             shop_name = url_match.group(1) if url_match else "unknown"
             product_id = url_match.group(2) if url_match else "unknown"
             
@@ -251,6 +291,7 @@ async def scrape_product_url(crawler, url: str, index: int, total: int) -> Dict:
             }
             
             print(f"   ✅ Success - {len(final_markdown):,} characters (links removed)")
+            page_cache.set(ResultCache.make_key(url), product_data)
             return product_data
             
         else:
@@ -279,26 +320,15 @@ async def scrape_product_url(crawler, url: str, index: int, total: int) -> Dict:
             "error_message": str(e)
         }
 
-async def bulk_scrape_products(urls: List[str], batch_size: int = 5) -> List[Dict]:
+def create_browser_config() -> BrowserConfig:
     """
-    Scrape multiple product URLs in batches with advanced configuration like page.py
+    Browser configuration like page.py for optimal e-commerce scraping
     
-    Args:
-        urls (List[str]): List of URLs to scrape
-        batch_size (int): Number of concurrent requests
-        
     Returns:
-        List[Dict]: List of scraped product data
+        BrowserConfig: Config for the shared AsyncWebCrawler
     """
     
-    print(f"🚀 Starting bulk scrape of {len(urls)} URLs (batch size: {batch_size})")
-    print("🔧 Using advanced configuration with link removal like page.py")
-    print("=" * 70)
-    
-    all_results = []
-    
-    # Configure browser like page.py for optimal e-commerce scraping
-    browser_config = BrowserConfig(
+    return BrowserConfig(
         headless=True,
         viewport_width=1920,             # Wide viewport for full product layouts
         viewport_height=1080,            # Tall viewport for complete product info
@@ -307,103 +337,168 @@ async def bulk_scrape_products(urls: List[str], batch_size: int = 5) -> List[Dic
         ignore_https_errors=True,        # Handle certificate issues
         text_mode=False,                 # Keep images for complete product data
     )
-    
-    async with AsyncWebCrawler(config=browser_config, verbose=False) as crawler:
-        # Process URLs in batches to avoid overwhelming the server
-        for i in range(0, len(urls), batch_size):
-            batch = urls[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            total_batches = (len(urls) + batch_size - 1) // batch_size
-            
-            print(f"\n📦 Batch {batch_num}/{total_batches} - Processing {len(batch)} URLs")
-            
-            # Create tasks for this batch
-            tasks = [
-                scrape_product_url(crawler, url, i + j, len(urls))
-                for j, url in enumerate(batch)
-            ]
-            
-            # Execute batch
-            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Process results
-            for result in batch_results:
-                if isinstance(result, Exception):
-                    print(f"   ❌ Batch exception: {result}")
-                else:
-                    all_results.append(result)
-            
-            # Small delay between batches
-            if i + batch_size < len(urls):
-                print(f"   ⏱️ Waiting 2 seconds before next batch...")
-                await asyncio.sleep(2)
-    
-    return all_results
 
-def save_results_to_json(results: List[Dict], output_file: str = 'rakuten.json') -> None:
+async def bulk_scrape_products(urls: List[str], batch_size: int = 5,
+                               on_result: Callable[[Dict], None] = None,
+                               keep_results: bool = True) -> List[Dict]:
     """
-    Save scraped results to JSON file
+    Scrape multiple product URLs concurrently with advanced configuration like page.py
+    
+    Up to batch_size pages are in flight at once; as soon as one finishes the
+    next URL starts, so no page waits for the slowest one of a batch.
     
     Args:
-        results (List[Dict]): List of scraped data
-        output_file (str): Output JSON file name
+        urls (List[str]): List of URLs to scrape
+        batch_size (int): Number of concurrent requests
+        on_result (Callable): Called with each result as soon as it completes
+        keep_results (bool): Collect and return the results (else returns [])
+        
+    Returns:
+        List[Dict]: List of scraped product data (in URL order)
     """
     
-    try:
-        # Create summary statistics
-        successful = [r for r in results if r.get('scrape_success', False)]
-        failed = [r for r in results if not r.get('scrape_success', False)]
+    print(f"🚀 Starting bulk scrape of {len(urls)} URLs (up to {batch_size} at a time)")
+    print("🔧 Using advanced configuration with link removal like page.py")
+    print("=" * 70)
+    
+    async with AsyncWebCrawler(config=create_browser_config(), verbose=False) as crawler:
+        # Bound the pages in flight to avoid overwhelming the server
+        semaphore = asyncio.Semaphore(batch_size)
         
-        total_content = sum(r.get('content_length', 0) for r in successful)
+        async def scrape(index: int, url: str) -> Dict:
+            async with semaphore:
+                result = await scrape_product_url(crawler, url, index, len(urls))
+            if on_result is not None:
+                on_result(result)
+            return result if keep_results else None
         
-        # Prepare final data structure
-        final_data = {
-            "scrape_metadata": {
-                "total_urls": len(results),
-                "successful_scrapes": len(successful),
-                "failed_scrapes": len(failed),
-                "total_content_length": total_content,
-                "success_rate": f"{(len(successful) / len(results) * 100):.1f}%" if results else "0%"
-            },
-            "products": results
+        # scrape_product_url turns its own failures into error entries, so
+        # every URL yields a result
+        results = await asyncio.gather(*(scrape(i, url) for i, url in enumerate(urls)))
+        return results if keep_results else []
+
+class ScrapeStats:
+    """Running totals for the rakuten.jsonl metadata header."""
+    
+    def __init__(self):
+        self.total_urls = 0
+        self.successful_scrapes = 0
+        self.total_content_length = 0
+    
+    def add(self, result: Dict) -> None:
+        self.total_urls += 1
+        if result.get('scrape_success', False):
+            self.successful_scrapes += 1
+            self.total_content_length += result.get('content_length', 0)
+    
+    def metadata(self) -> Dict:
+        return {
+            "total_urls": self.total_urls,
+            "successful_scrapes": self.successful_scrapes,
+            "failed_scrapes": self.total_urls - self.successful_scrapes,
+            "total_content_length": self.total_content_length,
+            "success_rate": f"{(self.successful_scrapes / self.total_urls * 100):.1f}%" if self.total_urls else "0%"
         }
+
+def print_save_summary(output_file: str, metadata: Dict) -> None:
+    """Report where the results went and the summary counters."""
+    print(f"\n💾 Results saved to {output_file}")
+    print(f"📊 Success rate: {metadata['successful_scrapes']}/{metadata['total_urls']} ({metadata['success_rate']})")
+    print(f"📄 Total content: {metadata['total_content_length']:,} characters")
+
+def build_results_data(results: List[Dict]) -> Dict:
+    """
+    Wrap scraped results with summary statistics (the rakuten.jsonl structure)
+    
+    Args:
+        results (List[Dict]): List of scraped data
         
-        # Save to JSON file
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(final_data, f, ensure_ascii=False, indent=2)
+    Returns:
+        Dict: Metadata plus products
+    """
+    
+    # Create summary statistics
+    stats = ScrapeStats()
+    for result in results:
+        stats.add(result)
+    
+    # Prepare final data structure
+    return {
+        "scrape_metadata": stats.metadata(),
+        "products": results
+    }
+
+def save_results_to_jsonl(results: List[Dict], output_file: str = 'rakuten.jsonl') -> None:
+    """
+    Save scraped results to JSONL file (metadata header line, then one product per line)
+    
+    Args:
+        results (List[Dict]): List of scraped data
+        output_file (str): Output JSONL file name
+    """
+    
+    try:
+        final_data = build_results_data(results)
+        metadata = final_data["scrape_metadata"]
         
-        print(f"\n💾 Results saved to {output_file}")
-        print(f"📊 Success rate: {len(successful)}/{len(results)} ({(len(successful) / len(results) * 100):.1f}%)")
-        print(f"📄 Total content: {total_content:,} characters")
+        # Save to JSONL file
+        write_jsonl(output_file, {"scrape_metadata": metadata}, results)
+        print_save_summary(output_file, metadata)
         
     except Exception as e:
         print(f"❌ Error saving results: {e}")
 
-async def main():
-    """Main function to orchestrate the bulk scraping process"""
+async def main(input_obj: Dict = None, persist: bool = True, keep_results: bool = True) -> Dict:
+    """Main function to orchestrate the bulk scraping process
+    
+    With persist, each result is appended to rakuten.jsonl as it completes; the
+    products are only held in memory when keep_results asks for them back.
+    """
     
     print("🛒 Rakuten Bulk Product Scraper")
     print("=" * 50)
     
-    # Load and validate URLs
-    urls = load_urls_from_file()
+    # Load and validate URLs (from the previous step's output if handed over)
+    urls = select_urls(input_obj) if input_obj is not None else load_urls_from_file()
     
     if not urls:
         print("❌ No valid URLs to scrape!")
-        return
+        return {}
     
     print(f"\n🎯 Will scrape {len(urls)} valid product URLs")
     
     print(f"\n🚀 Starting to scrape {len(urls)} URLs...")
     
-    # Perform bulk scraping
-    results = await bulk_scrape_products(urls, batch_size=3)  # Conservative batch size
-    
-    # Save results
-    save_results_to_json(results)
+    # Perform bulk scraping (conservative batch size), saving results as they arrive
+    output_file = 'rakuten.jsonl'
+    stats = ScrapeStats()
+    if persist:
+        with spool_jsonl(output_file, lambda: {"scrape_metadata": stats.metadata()}) as append:
+            def on_result(result: Dict):
+                stats.add(result)
+                append(result)
+            results = await bulk_scrape_products(urls, batch_size=3, on_result=on_result,
+                                                 keep_results=keep_results)
+        print_save_summary(output_file, stats.metadata())
+    else:
+        results = await bulk_scrape_products(urls, batch_size=3, on_result=stats.add)
     
     print(f"\n✅ Bulk scraping completed!")
-    print(f"📄 Check rakuten.json for the scraped product data")
+    if persist:
+        print(f"📄 Check rakuten.jsonl for the scraped product data")
+    
+    if not keep_results:
+        return {"scrape_metadata": stats.metadata()}
+    return {"scrape_metadata": stats.metadata(), "products": results}
+
+def run(input_obj: Dict = None, persist: bool = True, keep_results: bool = True) -> Dict:
+    """Pipeline entrypoint: scrape the extracted URLs and return the rakuten.jsonl structure"""
+    return asyncio.run(main(input_obj, persist=persist, keep_results=keep_results))
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop  # Optional: faster event loop for the many concurrent page loads
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    asyncio.run(main(keep_results=False))
@@ -1,12 +1,12 @@
-import json
 import csv
 import os
 from typing import List, Dict, Any
+from pipeline_io import atomic_open, load_jsonl
 
 class RakutenCSVConverter:
     def __init__(self):
         """Initialize the CSV converter."""
-        self.input_file = "rakuten_final.json"
+        self.input_file = "rakuten_final.jsonl"
         self.output_file = "rakuten.csv"
         
         # Define the CSV columns in the desired order
@@ -27,17 +27,15 @@ class RakutenCSVConverter:
         ]
 
     def load_json_data(self) -> List[Dict[str, Any]]:
-        """Load product data from rakuten_final.json."""
+        """Load product data from rakuten_final.jsonl."""
         try:
-            with open(self.input_file, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                products = data.get('products', [])
-                print(f"✅ Loaded {len(products)} products from {self.input_file}")
-                return products
+            products = load_jsonl(self.input_file, 'products')['products']
+            print(f"✅ Loaded {len(products)} products from {self.input_file}")
+            return products
         except FileNotFoundError:
             print(f"❌ File {self.input_file} not found")
             return []
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             print(f"❌ Error decoding JSON: {str(e)}")
             return []
         except Exception as e:
@@ -75,19 +73,24 @@ class RakutenCSVConverter:
                 null_count += 1
         return null_count
 
-    def convert_to_csv(self):
-        """Convert rakuten_final.json to rakuten.csv."""
+    def prepare_row(self, product: Dict[str, Any]) -> Dict[str, str]:
+        """Clean every CSV column of a product into a row dict."""
+        return {column: self.clean_data_for_csv(product.get(column)) for column in self.csv_columns}
+
+    def convert_to_csv(self, products: List[Dict[str, Any]] = None) -> int:
+        """Convert rakuten_final.jsonl (or already-loaded products) to rakuten.csv."""
         print("🚀 Starting JSON to CSV conversion...")
         
-        # Load JSON data
-        products = self.load_json_data()
+        # Load JSON data unless it was handed over in memory
+        if products is None:
+            products = self.load_json_data()
         if not products:
             print("❌ No products to convert")
-            return
+            return 0
         
         # Convert to CSV
         try:
-            with open(self.output_file, 'w', newline='', encoding='utf-8-sig') as csvfile:
+            with atomic_open(self.output_file, 'w', newline='', encoding='utf-8-sig') as csvfile:
                 writer = csv.DictWriter(csvfile, fieldnames=self.csv_columns)
                 
                 # Write header
@@ -104,15 +107,8 @@ class RakutenCSVConverter:
                         print(f"⏭️  Skipping product missing name/URL: {product.get('Web URL', 'Unknown URL')[:50]}...")
                         continue
                     
-                    # Clean and prepare row data
-                    row_data = {}
-                    for column in self.csv_columns:
-                        raw_value = product.get(column)
-                        cleaned_value = self.clean_data_for_csv(raw_value)
-                        row_data[column] = cleaned_value
-                    
-                    # Write row to CSV
-                    writer.writerow(row_data)
+                    # Write cleaned row to CSV
+                    writer.writerow(self.prepare_row(product))
                     processed_count += 1
                 
                 print(f"✅ Successfully converted {processed_count} products to {self.output_file}")
@@ -124,8 +120,11 @@ class RakutenCSVConverter:
                 for i, column in enumerate(self.csv_columns, 1):
                     print(f"   {i:2d}. {column}")
                 
+                return processed_count
+                
         except Exception as e:
             print(f"❌ Error writing CSV file: {str(e)}")
+            return 0
 
     def show_csv_preview(self, rows: int = 3):
         """Show a preview of the generated CSV file."""
@@ -179,7 +178,7 @@ def main():
     # Check if input file exists
     if not os.path.exists(converter.input_file):
         print(f"❌ Input file {converter.input_file} not found")
-        print("   Please make sure rakuten_final.json exists in the current directory")
+        print("   Please make sure rakuten_final.jsonl exists in the current directory")
         return
     
     # Convert to CSV
@@ -190,5 +189,15 @@ def main():
     
     print("\n✅ CSV conversion completed successfully!")
 
+def run(input_obj: Dict[str, Any] = None, persist: bool = True) -> int:
+    """Pipeline entrypoint: write rakuten.csv from rakuten_final.jsonl data.
+    
+    The CSV is the pipeline's final artifact, so it is always written.
+    Returns the number of rows written.
+    """
+    products = input_obj.get('products', []) if input_obj is not None else None
+    converter = RakutenCSVConverter()
+    return converter.convert_to_csv(products)
+
 if __name__ == "__main__":
     main()
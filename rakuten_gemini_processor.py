@@ -1,9 +1,11 @@
-import json
 import os
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import google.generativeai as genai
 from dotenv import load_dotenv
+from pipeline_http import configure_gemini, generate_content
+from pipeline_cache import ResultCache
+from pipeline_io import load_jsonl, loads, write_jsonl
 
 # Load environment variables
 load_dotenv()
@@ -16,14 +18,18 @@ class RakutenGeminiProcessor:
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
-        genai.configure(api_key=api_key)
+        configure_gemini(api_key)
         
         # Use Gemini 2.5 Flash Lite as it's the working model
-        self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+        self.model_name = 'gemini-2.5-flash-lite'
+        self.model = genai.GenerativeModel(self.model_name)
+        
+        # Per-product results from earlier runs (see pipeline_cache.py)
+        self.cache = ResultCache('gemini_products')
         
         # Processing configuration optimized for enhanced, clean content
         self.chunk_size = 5  # Increased to 5 as suggested - handles more products per chunk
-        self.delay_between_requests = 25  # Slightly reduced delay due to better content quality
+        # Request pacing comes from the shared limiter in pipeline_http (GEMINI_RPM)
         
         # Optimized prompt template for link-free, clean markdown content
         self.prompt_template = """You are an expert e-commerce data extractor specializing in Japanese cosmetics and beauty products. 
@@ -113,13 +119,11 @@ QUALITY ASSURANCE:
 VALIDATION: Return exactly {num_products} products matching the {num_products} clean product pages provided."""
 
     def load_rakuten_data(self, file_path: str) -> List[Dict[str, Any]]:
-        """Load data from rakuten.json file."""
+        """Load data from rakuten.jsonl file."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                products = data.get('products', [])
-                print(f"✅ Loaded {len(products)} products from {file_path}")
-                return products
+            products = load_jsonl(file_path, 'products')['products']
+            print(f"✅ Loaded {len(products)} products from {file_path}")
+            return products
         except Exception as e:
             print(f"❌ Error loading file {file_path}: {str(e)}")
             return []
@@ -197,7 +201,7 @@ VALIDATION: Return exactly {num_products} products matching the {num_products} c
             prompt = self.create_chunk_prompt(chunk)
             
             # Send to Gemini
-            response = self.model.generate_content(prompt)
+            response = generate_content(self.model, prompt)
             
             if not response.text:
                 print(f"❌ Empty response from Gemini for chunk {chunk_num}")
@@ -227,7 +231,7 @@ VALIDATION: Return exactly {num_products} products matching the {num_products} c
                 if array_match:
                     json_text = array_match.group(0)
                     try:
-                        extracted_data = json.loads(json_text)
+                        extracted_data = loads(json_text)
                         if isinstance(extracted_data, list):
                             # Validate: should have exactly the same number of products as input URLs
                             expected_count = len(chunk)
@@ -271,7 +275,7 @@ VALIDATION: Return exactly {num_products} products matching the {num_products} c
                     extracted_data = []
                     for obj_text in object_matches:
                         try:
-                            obj = json.loads(obj_text)
+                            obj = loads(obj_text)
                             extracted_data.append(obj)
                         except:
                             continue
@@ -282,7 +286,7 @@ VALIDATION: Return exactly {num_products} products matching the {num_products} c
                 
                 # If still no success, try the entire response as JSON
                 try:
-                    extracted_data = json.loads(response_text)
+                    extracted_data = loads(response_text)
                     if isinstance(extracted_data, dict):
                         extracted_data = [extracted_data]
                     elif isinstance(extracted_data, list):
@@ -308,22 +312,54 @@ VALIDATION: Return exactly {num_products} products matching the {num_products} c
             print(f"❌ Error processing chunk {chunk_num}: {str(e)}")
             return []
 
-    def process_all_products(self, input_file: str, output_file: str):
-        """Process all products from rakuten.json and save to rakuten_final.json."""
+    def product_cache_key(self, product: Dict[str, Any]) -> str:
+        """Cache key covering everything that determines a product's extraction."""
+        return ResultCache.make_key(self.model_name, self.prompt_template,
+                                    product.get('url', ''), product.get('markdown_content', ''))
+
+    def split_cached(self, products: List[Dict[str, Any]]) -> Tuple[List[Optional[Dict[str, Any]]], List[Dict[str, Any]]]:
+        """Look products up in the cache.
+        
+        Returns the cached results aligned with products (None where missing)
+        and the products that still need a Gemini call.
+        """
+        cached = [self.cache.get(self.product_cache_key(product)) for product in products]
+        pending = [product for product, result in zip(products, cached) if result is None]
+        return cached, pending
+
+    def cache_results(self, chunk: List[Dict[str, Any]], extracted_data: List[Dict[str, Any]]):
+        """Store each result under the product whose URL it carries; results matching no product aren't cached."""
+        products_by_url = {product.get('url'): product for product in chunk}
+        matched = []
+        for result in extracted_data:
+            product = products_by_url.pop(result.get('Web URL'), None)
+            if product is not None:
+                matched.append((self.product_cache_key(product), result))
+        self.cache.set_many(matched)
+
+    def process_all_products(self, input_file: str, output_file: str,
+                             products: List[Dict[str, Any]] = None, persist: bool = True) -> Dict[str, Any]:
+        """Process all products from rakuten.jsonl and save to rakuten_final.jsonl."""
         print("🚀 Starting Rakuten product processing with Gemini...")
         
-        # Load products
-        products = self.load_rakuten_data(input_file)
+        # Load products unless they were handed over in memory
+        if products is None:
+            products = self.load_rakuten_data(input_file)
         if not products:
             print("❌ No products to process")
-            return
+            return {}
+        
+        # Reuse results from earlier runs; only uncached products go to Gemini
+        cached_results, pending = self.split_cached(products)
+        all_extracted_data = [result for result in cached_results if result is not None]
+        if all_extracted_data:
+            print(f"♻️ Reusing {len(all_extracted_data)} cached products, {len(pending)} left to process")
         
         # Split into chunks
-        chunks = [products[i:i + self.chunk_size] for i in range(0, len(products), self.chunk_size)]
-        print(f"📦 Split {len(products)} products into {len(chunks)} chunks of {self.chunk_size} each")
+        chunks = [pending[i:i + self.chunk_size] for i in range(0, len(pending), self.chunk_size)]
+        print(f"📦 Split {len(pending)} products into {len(chunks)} chunks of {self.chunk_size} each")
         
         # Process each chunk
-        all_extracted_data = []
         successful_chunks = 0
         
         for i, chunk in enumerate(chunks, 1):
@@ -333,11 +369,7 @@ VALIDATION: Return exactly {num_products} products matching the {num_products} c
                 if extracted_data:
                     all_extracted_data.extend(extracted_data)
                     successful_chunks += 1
-                
-                # Add delay between requests to respect API limits
-                if i < len(chunks):  # Don't delay after the last chunk
-                    print(f"⏳ Waiting {self.delay_between_requests} seconds before next chunk...")
-                    time.sleep(self.delay_between_requests)
+                    self.cache_results(chunk, extracted_data)
                     
             except Exception as e:
                 print(f"❌ Failed to process chunk {i}: {str(e)}")
@@ -352,16 +384,17 @@ VALIDATION: Return exactly {num_products} products matching the {num_products} c
                     "successful_chunks": successful_chunks,
                     "extracted_products": len(all_extracted_data),
                     "processing_timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "chunk_size": self.chunk_size
+                    "chunk_size": self.chunk_size,
+                    "cached_products": len(products) - len(pending)
                 },
                 "products": all_extracted_data
             }
             
             try:
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(output_data, f, ensure_ascii=False, indent=2)
-                
-                print(f"✅ Successfully saved {len(all_extracted_data)} extracted products to {output_file}")
+                if persist:
+                    write_jsonl(output_file, {"metadata": output_data["metadata"]}, all_extracted_data)
+                    
+                    print(f"✅ Successfully saved {len(all_extracted_data)} extracted products to {output_file}")
                 print(f"📊 Processing Summary:")
                 print(f"   - Total products: {len(products)}")
                 print(f"   - Successful chunks: {successful_chunks}/{len(chunks)}")
@@ -369,13 +402,16 @@ VALIDATION: Return exactly {num_products} products matching the {num_products} c
                 
             except Exception as e:
                 print(f"❌ Error saving results: {str(e)}")
+            
+            return output_data
         else:
             print("❌ No data was successfully extracted")
+            return {}
 
 def main():
     """Main function to run the processing."""
-    input_file = "rakuten.json"
-    output_file = "rakuten_final.json"
+    input_file = "rakuten.jsonl"
+    output_file = "rakuten_final.jsonl"
     
     # Check if input file exists
     if not os.path.exists(input_file):
@@ -389,5 +425,12 @@ def main():
     except Exception as e:
         print(f"❌ Error initializing processor: {str(e)}")
 
+def run(input_obj: Dict[str, Any] = None, persist: bool = True) -> Dict[str, Any]:
+    """Pipeline entrypoint: structure scraped products (rakuten.jsonl data) with Gemini."""
+    products = input_obj.get('products', []) if input_obj is not None else None
+    processor = RakutenGeminiProcessor()
+    return processor.process_all_products("rakuten.jsonl", "rakuten_final.jsonl",
+                                          products=products, persist=persist)
+
 if __name__ == "__main__":
     main()
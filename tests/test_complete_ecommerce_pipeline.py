@@ -0,0 +1,48 @@
+"""Tests for complete_ecommerce_pipeline's streaming helpers"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from complete_ecommerce_pipeline import _next_batch
+
+def batches(items, max_items: int, max_wait: float = 0.05):
+    """Drain a queue pre-filled with items through _next_batch."""
+    async def run():
+        queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+        result = []
+        done = False
+        while not done:
+            batch, done = await _next_batch(queue, max_items, max_wait)
+            result.append(batch)
+        return result
+    
+    return asyncio.run(run())
+
+def test_next_batch_caps_batch_size():
+    assert batches([1, 2, 3, 4, 5, None], max_items=2) == [[1, 2], [3, 4], [5]]
+
+def test_next_batch_end_of_stream():
+    assert batches([None], max_items=3) == [[]]
+    assert batches([1, 2, None], max_items=3) == [[1, 2]]
+
+def test_next_batch_returns_partial_batch_after_max_wait():
+    async def run():
+        queue = asyncio.Queue()
+        queue.put_nowait("a")
+        
+        async def late():
+            await asyncio.sleep(0.2)
+            queue.put_nowait("b")
+        
+        feeder = asyncio.create_task(late())
+        first = await _next_batch(queue, 10, max_wait=0.05)
+        second = await _next_batch(queue, 10, max_wait=0.05)
+        await feeder
+        return first, second
+    
+    assert asyncio.run(run()) == ((["a"], False), (["b"], False))
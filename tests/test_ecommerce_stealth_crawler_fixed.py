@@ -0,0 +1,101 @@
+"""Tests for ecommerce_stealth_crawler_fixed's helpers"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ecommerce_stealth_crawler_fixed import GenericEcommerceCrawler, HostLimiter, chunked_text, crawl_retry_delay
+
+def write_lines(tmp: str, lines):
+    path = os.path.join(tmp, "rakuten.md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    return path
+
+def test_chunked_text_splits_on_whole_lines_by_size():
+    lines = [f"line {i:02d} ¥1,000\n" for i in range(10)]  # 17 characters each
+    with tempfile.TemporaryDirectory() as tmp:
+        chunks = list(chunked_text(write_lines(tmp, lines), target_size=40))
+    assert chunks == ["".join(lines[0:3]), "".join(lines[3:6]), "".join(lines[6:9]), lines[9]]
+
+def test_chunked_text_keeps_long_line_whole():
+    lines = ["x" * 100 + "\n", "short\n"]
+    with tempfile.TemporaryDirectory() as tmp:
+        assert list(chunked_text(write_lines(tmp, lines), target_size=10)) == lines
+        assert list(chunked_text(write_lines(tmp, []), target_size=10)) == []
+
+def test_host_limiter_grows_additively_and_halves_on_throttle():
+    limiter = HostLimiter(max_concurrency=4)
+    for _ in range(20):
+        limiter.record(True)
+    assert limiter.limit == 4
+    limiter.record(False)
+    assert limiter.limit == 2
+    for _ in range(5):
+        limiter.record(False)
+    assert limiter.limit == 1
+
+def test_host_limiter_caps_requests_in_flight():
+    limiter = HostLimiter(max_concurrency=4)
+    limiter.limit = 2
+    peak = 0
+    
+    async def request():
+        nonlocal peak
+        async with limiter:
+            peak = max(peak, limiter.active)
+            await asyncio.sleep(0.01)
+    
+    async def run():
+        await asyncio.gather(*(request() for _ in range(6)))
+    
+    asyncio.run(run())
+    assert peak == 2
+    assert limiter.active == 0
+
+def test_crawl_retry_delay_backs_off_and_honours_retry_after():
+    assert 4 <= crawl_retry_delay(2) < 5
+    assert crawl_retry_delay(10) == 30
+    assert crawl_retry_delay(0, SimpleNamespace(response_headers={"Retry-After": "12"})) == 12
+    assert crawl_retry_delay(0, SimpleNamespace(response_headers={"retry-after": "600"})) == 30
+    assert crawl_retry_delay(0, SimpleNamespace(response_headers=None)) < 2
+
+def make_crawler():
+    return GenericEcommerceCrawler.__new__(GenericEcommerceCrawler)
+
+def test_merge_product_data_fills_gaps_and_prefers_detail():
+    existing = {"Product_Name": "化粧水", "Price": None, "Product_Description": "short",
+                "Web_URL": "https://search.rakuten.co.jp/search/mall/x/", "Brand": "A"}
+    new = {"Price": 1200, "Product_Description": "a much longer description", "Brand": "B",
+           "Web_URL": "https://item.rakuten.co.jp/shop/item/", "Volume_Size": "null"}
+    merged = make_crawler()._merge_product_data(existing, new)
+    assert merged is existing
+    assert merged == {"Product_Name": "化粧水", "Price": 1200, "Product_Description": "a much longer description",
+                      "Web_URL": "https://item.rakuten.co.jp/shop/item/", "Brand": "A"}
+
+def test_merge_product_data_keeps_item_url_and_longer_text():
+    existing = {"Web_URL": "https://item.rakuten.co.jp/shop/a/", "Product_Description": "the long original text"}
+    new = {"Web_URL": "https://item.rakuten.co.jp/shop/b/", "Product_Description": "shorter"}
+    assert make_crawler()._merge_product_data(dict(existing), new) == existing
+
+def test_deduplicate_merges_exact_duplicates_and_keeps_variants():
+    products = [
+        {"Product_Name": "Lotion ", "Price": "¥1,200", "Brand": None},
+        {"Product_Name": "LOTION", "Price": "¥1,200", "Brand": "Shiseido"},
+        {"Product_Name": "Lotion", "Price": "¥2,000"},
+        {"Product_Name": "cream", "Price": "null"},
+        {"Product_Name": "cream", "Price": None},
+        {"Product_Name": "null", "Price": "¥500"},
+        {"Product_Name": "x", "Price": "¥500"},
+        "not a product",
+    ]
+    assert make_crawler()._ultra_aggressive_deduplicate(products) == [
+        {"Product_Name": "cream", "Price": None},
+        {"Product_Name": "cream", "Price": None},
+        {"Product_Name": "Lotion", "Price": "¥1,200", "Brand": "Shiseido"},
+        {"Product_Name": "Lotion", "Price": "¥2,000"},
+    ]
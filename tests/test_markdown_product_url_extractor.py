@@ -0,0 +1,71 @@
+"""Tests for MarkdownProductURLExtractor"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('GEMINI_API_KEY', 'test-key')
+
+from markdown_product_url_extractor import MarkdownProductURLExtractor
+
+def make_chunk(text: str, finish_reason: int = 1):
+    return SimpleNamespace(text=text, parts=[text] if text else [],
+                           candidates=[SimpleNamespace(finish_reason=finish_reason)])
+
+class FakeStream:
+    """A streamed response: async-iterable chunks that records whether it was closed."""
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.sent = 0
+        self.closed = False
+
+    async def __aiter__(self):
+        try:
+            for text in self.texts:
+                self.sent += 1
+                yield make_chunk(text)
+        finally:
+            self.closed = True
+
+def make_extractor(max_prompt_tokens: int = 200_000, max_urls_per_chunk: int = 500):
+    extractor = MarkdownProductURLExtractor.__new__(MarkdownProductURLExtractor)
+    extractor.max_prompt_tokens = max_prompt_tokens
+    extractor.max_urls_per_chunk = max_urls_per_chunk
+    return extractor
+
+def read(stream):
+    """Read stream; returns (text, whether the stream was closed before the loop ended)."""
+    extractor = make_extractor()
+    
+    async def run():
+        text = await extractor.read_response_stream(stream, 1)
+        return text, stream.closed
+    
+    return asyncio.run(run())
+
+def test_stream_closed_on_early_abort():
+    stream = FakeStream(["Sorry, ", "I can't", " help", " with that"])
+    assert read(stream) == (None, True)
+    assert stream.sent == 1
+
+def test_full_stream_is_joined():
+    stream = FakeStream([' {"product_url_numbers":', ' [1, 3]}'])
+    assert read(stream) == ('{"product_url_numbers": [1, 3]}', True)
+
+def test_pack_url_chunks_groups_hosts_in_first_seen_order():
+    urls = ["https://a.jp/1", "https://b.jp/1", "https://a.jp/2", "https://b.jp/2"]
+    assert make_extractor().pack_url_chunks(urls) == [["https://a.jp/1", "https://a.jp/2",
+                                                       "https://b.jp/1", "https://b.jp/2"]]
+
+def test_pack_url_chunks_respects_url_cap():
+    urls = [f"https://a.jp/item/{i}" for i in range(5)]
+    assert make_extractor(max_urls_per_chunk=2).pack_url_chunks(urls) == [urls[:2], urls[2:4], urls[4:]]
+
+def test_pack_url_chunks_respects_token_budget():
+    urls = ["https://a.jp/" + "x" * 27 for _ in range(4)]  # 40 characters: 10 + 3 tokens each
+    chunks = make_extractor(max_prompt_tokens=30).pack_url_chunks(urls)
+    assert chunks == [urls[:2], urls[2:]]
+    assert make_extractor().pack_url_chunks([]) == []
@@ -0,0 +1,25 @@
+"""Tests for page.py's text helpers"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from page import LINK_OR_URL_PATTERN, count_keywords, remove_link
+
+def strip_links(text: str) -> str:
+    return LINK_OR_URL_PATTERN.sub(remove_link, text)
+
+def test_remove_link_keeps_link_text():
+    assert strip_links("Buy [ELIXIR lotion](https://item.rakuten.co.jp/a/b/) now") == "Buy ELIXIR lotion now"
+    assert strip_links("[empty]() and [](https://x.jp/)") == "empty and "
+
+def test_remove_link_drops_bare_urls_and_urls_in_link_text():
+    assert strip_links("see https://x.jp/a?b=1 (or http://y.jp)") == "see  (or )"
+    assert strip_links("[https://x.jp/a shop](https://x.jp/a)") == " shop"
+
+def test_count_keywords_any_case_in_list_order():
+    text = "SHISEIDO Elixir lotion – elixir daycare by shiseido, 資生堂の化粧品"
+    assert count_keywords(text) == ["'elixir' (2x)", "'daycare' (1x)", "'shiseido' (2x)",
+                                    "'資生堂' (1x)", "'化粧品' (1x)"]
+    assert count_keywords("nothing here") == []
@@ -0,0 +1,56 @@
+"""Tests for pipeline_http's rate limiter and retry helpers"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline_http import TokenBucket, parse_retry_after, retry_delay
+
+class ApiError(Exception):
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(message)
+        self.code = code
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(60, burst=2)  # one token per second
+    assert bucket._take() == 0
+    assert bucket._take() == 0
+    wait = bucket._take()
+    assert 0 < wait <= 1
+
+def test_token_bucket_caps_cost_at_burst():
+    bucket = TokenBucket(600, burst=10)
+    assert bucket._take(cost=50) == 0
+    assert bucket._take(cost=1) > 0
+
+def test_token_bucket_pause_blocks_callers():
+    bucket = TokenBucket(6000, burst=5)
+    bucket.pause(30)
+    assert bucket._take() > 29
+
+def test_parse_retry_after():
+    assert parse_retry_after(Exception("429 Quota exceeded. Please retry in 38.2s.")) == 38.2
+    assert parse_retry_after(Exception("retry_delay { seconds: 12 }")) == 12
+    assert parse_retry_after(Exception("500 Internal error")) is None
+
+def test_retry_delay_honours_server_hint_and_pauses_on_429():
+    bucket = TokenBucket(6000, burst=5)
+    delay = retry_delay(ApiError(429, "Please retry in 20s"), 0, 5, bucket)
+    assert 20 <= delay <= 21
+    assert bucket._take() > 19
+
+def test_retry_delay_backs_off_on_5xx_without_pausing():
+    bucket = TokenBucket(6000, burst=5)
+    assert 8 <= retry_delay(ApiError(503), 3, 5, bucket) <= 9
+    assert bucket._take() == 0
+
+def test_retry_delay_reraises_when_not_retryable():
+    bucket = TokenBucket(60)
+    for error, attempt in ((ApiError(400), 0), (ApiError(429), 5), (ValueError("bad"), 0)):
+        try:
+            retry_delay(error, attempt, 5, bucket)
+        except Exception as e:
+            assert e is error
+        else:
+            raise AssertionError(f"{error!r} was retried")
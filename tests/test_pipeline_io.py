@@ -0,0 +1,60 @@
+"""Tests for pipeline_io's JSONL helpers"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline_io import iter_jsonl, load_jsonl, spool_jsonl, write_jsonl
+
+def test_write_and_load_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.jsonl")
+        assert write_jsonl(path, {"meta": {"n": 2}}, [{"url": "a"}, {"name": "商品"}]) == 2
+        assert load_jsonl(path, "products") == {"meta": {"n": 2}, "products": [{"url": "a"}, {"name": "商品"}]}
+        assert not os.path.exists(path + ".tmp")
+
+def test_iter_jsonl_skips_truncated_last_line():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.jsonl")
+        with open(path, "wb") as f:
+            f.write(b'{"meta": 1}\n\n{"url": "a"}\n{"url": "b')
+        assert list(iter_jsonl(path)) == [{"meta": 1}, {"url": "a"}]
+
+def test_iter_jsonl_raises_on_corrupt_complete_line():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.jsonl")
+        with open(path, "wb") as f:
+            f.write(b'{"meta": 1}\n{"url": \n{"url": "a"}\n')
+        try:
+            list(iter_jsonl(path))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("corrupt line was skipped")
+
+def test_spool_jsonl_writes_header_from_final_totals():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.jsonl")
+        totals = {"count": 0}
+        with spool_jsonl(path, lambda: {"meta": dict(totals)}) as append:
+            for url in ("a", "b", "c"):
+                append({"url": url})
+                totals["count"] += 1
+        assert load_jsonl(path, "products") == {"meta": {"count": 3},
+                                                "products": [{"url": "a"}, {"url": "b"}, {"url": "c"}]}
+        assert os.listdir(tmp) == ["out.jsonl"]
+
+def test_spool_jsonl_keeps_previous_file_on_error():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.jsonl")
+        write_jsonl(path, {"meta": "old"}, [])
+        try:
+            with spool_jsonl(path, lambda: {"meta": "new"}) as append:
+                append({"url": "a"})
+                raise RuntimeError("scrape crashed")
+        except RuntimeError:
+            pass
+        assert load_jsonl(path, "products") == {"meta": "old", "products": []}
+        assert os.listdir(tmp) == ["out.jsonl"]
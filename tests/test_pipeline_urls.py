@@ -0,0 +1,38 @@
+"""Tests for pipeline_urls"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline_urls import canonical_url, dedupe_urls, url_template
+
+def test_redirect_path_keeps_embedded_url():
+    url = ("https://aax-fe.amazon.co.jp/x/c/JAbN/https://www.amazon.co.jp/stores/page/068FD3F3/"
+           "?_encoding=UTF8&pd_rd_w=oMM9j&ref_=sbx_be")
+    assert canonical_url(url) == ("https://aax-fe.amazon.co.jp/x/c/JAbN/"
+                                  "https://www.amazon.co.jp/stores/page/068FD3F3/?_encoding=UTF8")
+
+def test_leading_slashes_collapsed():
+    assert canonical_url("https://item.rakuten.co.jp//shop/item/") == "https://item.rakuten.co.jp/shop/item/"
+
+def test_query_text_kept_when_params_dropped():
+    url = "HTTPS://Item.Rakuten.co.jp/shop/item/?flag&q=%7E&utm_source=x&scid=1&sig=a%2Bb#top"
+    assert canonical_url(url) == "https://item.rakuten.co.jp/shop/item/?flag&q=%7E&sig=a%2Bb"
+
+def test_dedupe_urls_drops_tracking_variants():
+    urls = ["https://item.rakuten.co.jp/shop/item/?scid=1",
+            "https://item.rakuten.co.jp/shop/item/?scid=2#x",
+            "https://item.rakuten.co.jp/shop/other/"]
+    assert dedupe_urls(urls) == ["https://item.rakuten.co.jp/shop/item/",
+                                 "https://item.rakuten.co.jp/shop/other/"]
+
+def test_url_template_replaces_id_segments():
+    assert url_template("https://www.amazon.co.jp/dp/B0ABCDEF12/ref=sr_1_1?keywords=x") == "www.amazon.co.jp/dp/{id}"
+    assert url_template("https://WWW.Rakuten.co.jp/category/100939/#top") == "www.rakuten.co.jp/category/{id}/"
+
+def test_url_template_groups_pages_that_differ_only_by_id():
+    assert (url_template("https://item.rakuten.co.jp/shop/4901234567890/") ==
+            url_template("https://item.rakuten.co.jp/shop/abc-123/?scid=1"))
+    assert (url_template("https://item.rakuten.co.jp/shop/4901234567890/") !=
+            url_template("https://item.rakuten.co.jp/shop/guide/"))